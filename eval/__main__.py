@@ -1,6 +1,7 @@
 import asyncio
 import json
 import logging
+import time
 from pathlib import Path
 from typing import Any
 
@@ -11,6 +12,8 @@ from tqdm.asyncio import tqdm_asyncio
 from eval.metrics import MetricsCollector
 from src.ai.analyzer import analyze_document
 from src.ai.client import async_client
+from src.ai.llm import count_usage, estimate_call_tokens, scheduler
+from src.metrics import metrics as pipeline_metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", datefmt="%H:%M:%S")
@@ -76,16 +79,24 @@ async def evaluate_analysis(
         pipeline_answer=json.dumps(pipeline_answer["issues"], ensure_ascii=False, indent=2),
     )
 
-    judge_response = await async_client.chat.completions.create(
-        model=JUDGE_MODEL,
-        response_format={"type": "json_object"},
-        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": judge_prompt}],
-        temperature=0,
-        top_p=1,
-        max_tokens=1000,
-        seed=4564128811,
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": judge_prompt}]
+    # Shares rate limits, adaptive concurrency and retries with the analyzer calls of the other test cases
+    judge_response = await scheduler.call(
+        lambda: async_client.chat.completions.create(
+            model=JUDGE_MODEL,
+            response_format={"type": "json_object"},
+            messages=messages,  # type: ignore[arg-type]
+            temperature=0,
+            top_p=1,
+            max_tokens=1000,
+            seed=4564128811,
+        ),
+        estimated_tokens=estimate_call_tokens(messages),
+        tokens_used=lambda response: response.usage.total_tokens if response.usage else None,
     )
 
+    if judge_response.usage:
+        count_usage(judge_response.usage.model_dump(), "eval_judge")
     content = judge_response.choices[0].message.content
     if content is None:
         raise ValueError("Received empty response from LLM")
@@ -119,7 +130,9 @@ async def run_analysis():
             tasks.append(task)
 
     # Run all tasks in parallel and collect results
+    start = time.perf_counter()
     results = await tqdm_asyncio.gather(*tasks, desc="Processing test cases")
+    wall_seconds = time.perf_counter() - start
 
     for gt_issue_type, case, pipeline_answer, evaluation in results:
         bad = not evaluation["is_correct"] or evaluation["score"] < 7
@@ -159,6 +172,30 @@ async def run_analysis():
     print(f"Average Score: {summary['average_score']:.2f}")
     print(f"Correct Ratio: {summary['correct_ratio']:.2%}")
 
+    # Every test case has an issue, so a case the triage cascade found clean is a miss
+    triaged = [pipeline_answer["triage"] for _, _, pipeline_answer, _ in results if "triage" in pipeline_answer]
+    if triaged:
+        clean = sum(1 for triage in triaged if not triage["suspicious_sections"])
+        print(f"Triage: {len(triaged) - clean} of {len(triaged)} test cases sent to the analysis, {clean} found clean")
+
+    # Where the wall clock went: stages of concurrent cases overlap, so their sum exceeds the wall time
+    print(f"\nWall Time: {wall_seconds:.1f}s")
+    stages = pipeline_metrics.to_json()["summaries"].get("stage_seconds", [])
+    stage_table = [
+        [series["labels"]["stage"], series["count"], f"{series['sum']:.2f}", f"{series['max']:.2f}"]
+        for series in stages
+    ]
+    print(tabulate(stage_table, headers=["Stage", "Count", "Total, s", "Max, s"], tablefmt="github"))
+
+    # Token spend of the pipeline by stage, e.g. what the triage costs and what it saves the analysis
+    tokens: dict[str, dict[str, float]] = {}
+    for series in pipeline_metrics.to_json()["counters"].get("llm_tokens", []):
+        tokens.setdefault(series["labels"]["stage"], {})[series["labels"]["kind"]] = series["value"]
+    token_table = [
+        [stage, f"{kinds.get('prompt', 0):.0f}", f"{kinds.get('completion', 0):.0f}"] for stage, kinds in tokens.items()
+    ]
+    print(tabulate(token_table, headers=["Stage", "Prompt tokens", "Completion tokens"], tablefmt="github"))
+
 
 if __name__ == "__main__":
     asyncio.run(run_analysis())
@@ -0,0 +1,87 @@
+"""
+Cost of diff highlighting on the pairs of the eval corpus (original text and its corrected version), character-level
+with default settings versus word-level with the configured timeout, cold and memoized.
+
+    uv run python scripts/benchmark_diff.py [--repeat N]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import yaml
+from diff_match_patch import diff_match_patch
+from tabulate import tabulate
+
+# add parent dir to sys.path
+sys.path.append(str(Path(__file__).parents[1]))
+from src.config import settings  # noqa: E402
+from src.ui.diff import diff_words, highlight_differences  # noqa: E402
+
+TEST_CASES = Path(__file__).parents[1] / "eval" / "test_cases.yaml"
+
+
+def load_pairs() -> list[tuple[str, str]]:
+    with TEST_CASES.open() as f:
+        test_cases = yaml.safe_load(f)
+    pairs = [(case["input_text"], case["negative"]) for cases in test_cases.values() for case in cases]
+    # Long citations: the whole corpus as one text
+    pairs.append(("\n".join(original for original, _ in pairs), "\n".join(corrected for _, corrected in pairs)))
+    return pairs
+
+
+def diff_characters(original: str, corrected: str) -> list[tuple[int, str]]:
+    """The previous implementation: a new engine per call, character-level, default one second timeout."""
+    dmp = diff_match_patch()
+    diffs = dmp.diff_main(original, corrected)
+    dmp.diff_cleanupSemantic(diffs)
+    return diffs
+
+
+def measure(pairs: list[tuple[str, str]], function: Callable[[str, str], object], repeat: int) -> list[float]:
+    timings = []
+    for original, corrected in pairs:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(original, corrected)
+        timings.append((time.perf_counter() - start) / repeat * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per pair")
+    args = parser.parse_args()
+
+    pairs = load_pairs()
+    longest = max(len(original) + len(corrected) for original, corrected in pairs)
+    print(f"{len(pairs)} pairs, up to {longest} characters; diff timeout: {settings.ui.diff_timeout_seconds}s")
+
+    highlight_differences.cache_clear()
+    rows = []
+    for name, function, repeat in (
+        ("characters", diff_characters, args.repeat),
+        ("words", diff_words, args.repeat),
+        ("words + HTML, cold", highlight_differences, 1),
+        ("words + HTML, memoized", highlight_differences, args.repeat),
+    ):
+        timings = measure(pairs, function, repeat)
+        rows.append(
+            [
+                name,
+                f"{statistics.median(timings):.3f}",
+                f"{statistics.quantiles(timings, n=20)[-1]:.3f}",
+                f"{max(timings):.3f}",
+                f"{sum(timings):.1f}",
+            ]
+        )
+
+    headers = ["Diff", "Median, ms", "p95, ms", "Max, ms", "Total, ms"]
+    print(tabulate(rows, headers=headers, tablefmt="github"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Per-stage cost of manual check hints on the bundled example corpus, the throughput of hints generated one
+document at a time versus for all documents with shared NER batches, and the hit rate of the sentence memo.
+
+    uv run python scripts/benchmark_hints.py [FILE_OR_DIR ...]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from tabulate import tabulate
+
+# add parent dir to sys.path
+sys.path.append(str(Path(__file__).parents[1]))
+from src.ai.hints import (  # noqa: E402
+    NLP_STAGES,
+    STAGE_DEPENDENCIES,
+    generate_manual_check_hints,
+    generate_manual_check_hints_batch,
+    required_stages,
+)
+from src.ai.nlp import get_nlp, sentence_cache  # noqa: E402
+from src.ai.parse_markitdown import parse  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.metrics import metrics  # noqa: E402
+
+EXAMPLES_DIR = Path(__file__).parents[1] / "examples"
+
+
+def collect(paths: list[Path]) -> list[Path]:
+    files = []
+    for path in paths:
+        files.extend(sorted(p for p in path.glob("**/*.*")) if path.is_dir() else [path])
+    return files
+
+
+def time_stages(text: str) -> dict[str, float]:
+    """Time every Natasha stage separately on the same text."""
+    from natasha import Doc  # type: ignore
+
+    nlp = get_nlp()
+    doc = Doc(text)
+    timings = {}
+    for stage, run in (
+        ("segment", lambda: doc.segment(nlp.segmenter)),
+        ("morph", lambda: doc.tag_morph(nlp.morph_tagger)),
+        ("syntax", lambda: doc.parse_syntax(nlp.syntax_parser)),
+        ("ner", lambda: doc.tag_ner(nlp.ner_tagger)),
+    ):
+        start = time.perf_counter()
+        run()
+        timings[stage] = time.perf_counter() - start
+    return timings
+
+
+def memo_hit_rate() -> str:
+    """Share of distinct sentences served from the sentence memo since the last `metrics.reset()`."""
+    memo, model = metrics.total("nlp_sentences", source="memo"), metrics.total("nlp_sentences", source="model")
+    duplicates = metrics.total("nlp_sentences", source="duplicate")
+    return (
+        f"{memo / (memo + model) if memo + model else 0:.1%} of {memo + model:.0f} distinct sentences from the memo, "
+        f"{duplicates:.0f} repeats"
+    )
+
+
+def main() -> None:
+    files = collect([Path(arg) for arg in sys.argv[1:]] or [EXAMPLES_DIR])
+    checks = settings.ai.manual_hint_checks
+    # Every pass starts with an empty memo, not with sentences memoized on disk by earlier runs
+    settings.cache.nlp_path = None
+    selected = required_stages(checks)
+    print(f"Enabled checks: {', '.join(checks)}")
+    print(f"Selected stages: {', '.join(selected) or 'none'} (dependencies: {STAGE_DEPENDENCIES})")
+    get_nlp()  # exclude the cold start from per-document timings
+
+    rows = []
+    texts = []
+    metrics.reset()
+    totals = dict.fromkeys([*NLP_STAGES, "all stages", "hints"], 0.0)
+    for file in files:
+        text = parse(file)
+        texts.append(text)
+        timings = time_stages(text)
+        timings["all stages"] = sum(timings.values())
+        start = time.perf_counter()
+        generate_manual_check_hints(text, checks)
+        timings["hints"] = time.perf_counter() - start
+        for key, value in timings.items():
+            totals[key] += value
+        rows.append([file.name[:60], len(text), *(f"{timings[key]:.3f}" for key in totals)])
+    rows.append(["TOTAL", "", *(f"{value:.3f}" for value in totals.values())])
+
+    headers = ["File", "Chars", *(f"{key}, s" for key in totals)]
+    print(tabulate(rows, headers=headers, tablefmt="github"))
+    print(f"\nOne at a time: {memo_hit_rate()}")
+
+    sentence_cache().clear()
+    metrics.reset()
+    start = time.perf_counter()
+    generate_manual_check_hints_batch(texts, checks)
+    batched = time.perf_counter() - start
+    print(f"Batched: {memo_hit_rate()}")
+
+    metrics.reset()
+    start = time.perf_counter()
+    generate_manual_check_hints_batch(texts, checks)
+    repeated = time.perf_counter() - start
+    print(f"Batched again: {memo_hit_rate()}")
+
+    print(
+        f"\nDocuments per second: {len(texts) / totals['hints']:.2f} one at a time, {len(texts) / batched:.2f} batched "
+        f"({totals['hints'] / batched:.2f}x), {len(texts) / repeated:.2f} batched again ({totals['hints'] / repeated:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Memory of worker processes running the Natasha models, with the weights loaded into every worker versus
+memory-mapped from `cache.nlp_weights_path`: RSS, PSS (shared pages split between the processes mapping them)
+and private memory of each worker while all of them are alive. Linux only: reads /proc/self/smaps_rollup.
+
+    uv run python scripts/benchmark_nlp_memory.py [--workers N]
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import sys
+from pathlib import Path
+from typing import Any
+
+import yaml
+from tabulate import tabulate
+
+# add parent dir to sys.path
+sys.path.append(str(Path(__file__).parents[1]))
+
+TEST_CASES = Path(__file__).parents[1] / "eval" / "test_cases.yaml"
+
+
+def memory_mb() -> dict[str, float]:
+    fields = {}
+    for line in Path("/proc/self/smaps_rollup").read_text().splitlines()[1:]:
+        key, value, *_ = line.split()
+        fields[key.rstrip(":")] = int(value) / 1024
+    return {"RSS": fields["Rss"], "PSS": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def worker(weights_path: str | None, text: str, barrier: Any, results: Any) -> None:
+    from src.config import settings
+
+    settings.cache.nlp_weights_path = weights_path
+    settings.cache.nlp_memory_sentences = 0
+    from src.ai.hints import run_nlp
+
+    before = memory_mb()["RSS"]
+    run_nlp(text, ["segment", "morph", "syntax", "ner"])
+    # Measure while every worker has its models loaded, so shared pages are split between all of them
+    barrier.wait()
+    results.put({"before": before, **memory_mb()})
+    barrier.wait()
+
+
+def measure(weights_path: str | None, workers: int, text: str) -> list[dict[str, float]]:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(weights_path, text, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes loading the models at the same time")
+    args = parser.parse_args()
+
+    from src.config import settings
+
+    with TEST_CASES.open() as f:
+        test_cases = yaml.safe_load(f)
+    text = "\n".join(case["input_text"] for cases in test_cases.values() for case in cases)
+
+    rows = []
+    for name, weights_path in (("private", None), ("memory-mapped", settings.cache.nlp_weights_path)):
+        measurements = measure(weights_path, args.workers, text)
+        rows.append(
+            [
+                name,
+                f"{statistics.mean(m['before'] for m in measurements):.0f}",
+                *(f"{statistics.mean(m[key] for m in measurements):.0f}" for key in ("RSS", "PSS", "private")),
+                f"{sum(m['PSS'] for m in measurements):.0f}",
+            ]
+        )
+
+    print(f"{args.workers} workers; weights directory: {settings.cache.nlp_weights_path}")
+    headers = ["Weights", "RSS before, MB", "RSS, MB", "PSS, MB", "Private, MB", "PSS of all workers, MB"]
+    print(tabulate(rows, headers=headers, tablefmt="github"))
+
+
+if __name__ == "__main__":
+    main()
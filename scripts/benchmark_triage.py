@@ -0,0 +1,87 @@
+"""
+Quality and savings of the triage cascade: recall on the eval corpus (every input text has an issue, so it must be
+found suspicious), share of the corrected texts found clean, and the analysis prompt tokens left on documents.
+Runs the given triage stages, by default only the local heuristic, which needs no API key.
+
+    uv run python scripts/benchmark_triage.py [--stages heuristic model] [FILE_OR_DIR ...]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import yaml
+from tabulate import tabulate
+
+# add parent dir to sys.path
+sys.path.append(str(Path(__file__).parents[1]))
+from src.ai.parse_markitdown import parse  # noqa: E402
+from src.ai.preflight import prompt_overhead_tokens  # noqa: E402
+from src.ai.tokens import count_tokens  # noqa: E402
+from src.ai.triage import triage_document  # noqa: E402
+from src.config import settings  # noqa: E402
+
+EXAMPLES_DIR = Path(__file__).parents[1] / "examples"
+TEST_CASES = Path(__file__).parents[1] / "eval" / "test_cases.yaml"
+
+
+def collect(paths: list[Path]) -> list[Path]:
+    files = []
+    for path in paths:
+        files.extend(sorted(p for p in path.glob("**/*.*")) if path.is_dir() else [path])
+    return files
+
+
+async def suspicious(texts: list[str]) -> list[bool]:
+    """Whether the triage sends any part of each text to the analysis."""
+    triages = await asyncio.gather(*(triage_document(text) for text in texts))
+    return [any(triage.suspicious) for triage in triages]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", type=Path, help="Documents or directories (default: the examples)")
+    parser.add_argument("--stages", nargs="+", choices=["heuristic", "model"], default=["heuristic"])
+    args = parser.parse_args()
+    settings.ai.triage = args.stages
+
+    with TEST_CASES.open() as f:
+        test_cases = yaml.safe_load(f)
+    cases = [case for cases in test_cases.values() for case in cases]
+    found = await suspicious([case["input_text"] for case in cases])
+    corrected = await suspicious([case["negative"] for case in cases])
+    print(f"Triage stages: {' -> '.join(args.stages)}")
+    print(f"Eval corpus: texts with issues found suspicious: {sum(found)} of {len(cases)}")
+    print(f"Corrected texts found clean: {len(cases) - sum(corrected)} of {len(cases)}")
+
+    rows = []
+    totals = [0, 0]
+    for file in collect(args.paths or [EXAMPLES_DIR]):
+        text = parse(file)
+        started = time.perf_counter()
+        triage = await triage_document(text)
+        seconds = time.perf_counter() - started
+        before = count_tokens(text) + prompt_overhead_tokens()
+        after = sum(count_tokens(text[start:end]) + prompt_overhead_tokens() for start, end in triage.spans)
+        totals[0] += before
+        totals[1] += after
+        summary = triage.summary()
+        rows.append(
+            [
+                file.name[:60],
+                f"{summary['suspicious_sections']}/{summary['sections']}",
+                f"{summary['analyzed_chars'] / len(text) if text else 0:.1%}",
+                before,
+                after,
+                f"{seconds:.3f}",
+            ]
+        )
+    rows.append(["TOTAL", "", "", totals[0], totals[1], ""])
+    headers = ["File", "Suspicious sections", "Analyzed text", "Prompt tokens before", "after", "Triage, s"]
+    print(tabulate(rows, headers=headers, tablefmt="github"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
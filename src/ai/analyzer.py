@@ -1,151 +1,82 @@
+import asyncio
+import bisect
 import json
 import re
-from re import Pattern
+import time
+from collections.abc import AsyncIterator, Coroutine
 from typing import Any
 
-from natasha import (  # type: ignore
-    Doc,
-    MorphVocab,
-    NewsEmbedding,
-    NewsMorphTagger,
-    NewsNERTagger,
-    NewsSyntaxParser,
-    Segmenter,
-)
-
-from src.ai.client import async_client
+from src.ai.chunking import Chunk, split_document, split_sections
+from src.ai.hints import generate_manual_check_hints_async
+from src.ai.json_stream import ArrayItemStreamParser
+from src.ai.llm import chat_completion, stream_chat_completion, system_message
+from src.ai.preflight import AnalysisPlan, plan_analysis
+from src.ai.triage import triage_document
 from src.config import prompts, settings
 from src.logging_ import logger
-
-# Initialize Natasha components for org name detection
-segmenter = Segmenter()
-morph_vocab = MorphVocab()
-emb = NewsEmbedding()
-morph_tagger = NewsMorphTagger(emb)
-syntax_parser = NewsSyntaxParser(emb)
-ner_tagger = NewsNERTagger(emb)
-
-# Legal document patterns
-LEGAL_PATTERNS: list[tuple[Pattern[str], str, str]] = [
-    # Competency patterns
-    (re.compile(r"\b[Рр]аспоряжение\b.*\b[Пп]равительства\b"), "распоряжение Правительства", "competency"),
-    (re.compile(r"\b[Пп]риказ\b.*\b[Дд]епартамента\b"), "приказ Департамента", "competency"),
-    (re.compile(r"\b[Пп]остановление\b.*\b[Аа]дминистрации\b"), "постановление Администрации", "competency"),
-    # Date patterns
-    (re.compile(r"(\d{2})\.(\d{2})\.(\d{4})\s*г\.?"), "DD.MM.YYYY г.", "date"),
-    (re.compile(r"(\d{2})\.(\d{2})\.(\d{4})"), "DD.MM.YYYY", "date"),
-    (re.compile(r"(\d{4})-(\d{2})-(\d{2})"), "YYYY-MM-DD", "date"),
-    (re.compile(r"(\d{2})/(\d{2})/(\d{4})"), "DD/MM/YYYY", "date"),
-    (re.compile(r"(\d{2})\s+(\d{2})\s+(\d{4})"), "DD MM YYYY", "date"),
-    # Legal term patterns
-    (re.compile(r"\b[Вв]праве\b.*\b[Нн]е\b"), "negative_right", "legal_term"),
-    (re.compile(r"\b[Оо]бязан\b.*\b[Нн]е\b"), "negative_obligation", "legal_term"),
-    (re.compile(r"\b[Дд]олжен\b.*\b[Нн]е\b"), "negative_must", "legal_term"),
-    # Document reference patterns
-    (re.compile(r"\b[Пп]ункт\b\s+\d+\.\d+"), "point_reference", "reference"),
-    (re.compile(r"\b[Сс]татья\b\s+\d+"), "article_reference", "reference"),
-    (re.compile(r"\b[Пп]одпункт\b\s+\d+\.\d+\.\d+"), "subpoint_reference", "reference"),
-]
-
-# Legal terminology dictionary
-LEGAL_TERMS: dict[str, dict[str, list[Pattern[str]] | list[str]]] = {
-    "competency": {
-        "patterns": [
-            re.compile(r"\b[Рр]аспоряжение\b"),
-            re.compile(r"\b[Пп]риказ\b"),
-            re.compile(r"\b[Пп]остановление\b"),
-            re.compile(r"\b[Уу]каз\b"),
-        ],
-        "context": ["Правительства", "Департамента", "Администрации", "Министерства"],
-    },
-    "rights": {
-        "patterns": [
-            re.compile(r"\b[Вв]праве\b"),
-            re.compile(r"\b[Ии]меет право\b"),
-            re.compile(r"\b[Мм]ожет\b"),
-        ],
-        "context": ["не", "обязан", "должен"],
-    },
-    "obligations": {
-        "patterns": [
-            re.compile(r"\b[Оо]бязан\b"),
-            re.compile(r"\b[Дд]олжен\b"),
-            re.compile(r"\b[Нн]еобходимо\b"),
-        ],
-        "context": ["не", "может", "вправе"],
+from src.metrics import metrics
+
+JUDGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "judge_response",
+        "schema": {
+            "type": "object",
+            "required": ["issues"],
+            "additionalProperties": False,
+            "properties": {
+                "issues": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": [
+                            "criterion",
+                            "citation",
+                            "explanation",
+                            "recommendation",
+                            "corrected_text",
+                        ],
+                        "additionalProperties": False,
+                        "properties": {
+                            "criterion": {
+                                "type": "string",
+                                "description": "Название критерия из списка проблем",
+                            },
+                            "citation": {
+                                "type": "string",
+                                "description": "Цитата из текста, содержащая проблему",
+                            },
+                            "explanation": {
+                                "type": "string",
+                                "description": "Объяснение, почему это является проблемой",
+                            },
+                            "recommendation": {
+                                "type": "string",
+                                "description": "Рекомендация по исправлению",
+                            },
+                            "corrected_text": {
+                                "type": "string",
+                                "description": "Исправленный вариант текста",
+                            },
+                        },
+                    },
+                }
+            },
+        },
+        "strict": True,
     },
 }
 
 
-def generate_manual_check_hints(document_text: str) -> list[str]:
-    """Generate hints from manual checks to help LLM analysis."""
-    hints = []
-
-    # Process document with Natasha
-    doc = Doc(document_text)
-    doc.segment(segmenter)
-    doc.tag_morph(morph_tagger)
-    doc.parse_syntax(syntax_parser)
-    doc.tag_ner(ner_tagger)
-
-    # Check for organization names with improved formatting
-    for span in doc.spans:
-        if span.type == "ORG":
-            org_name = span.text
-            formatted_name = format_org_name(org_name)
-            if org_name != formatted_name:
-                hints.append(
-                    f"Обнаружено потенциально неправильное написание организации: '{org_name}' -> '{formatted_name}'"
-                )
-
-    # Check for legal patterns
-    for pattern, format_name, pattern_type in LEGAL_PATTERNS:
-        for match in pattern.finditer(document_text):
-            if pattern_type == "date":
-                hints.append(f"Обнаружена дата в формате {format_name}, что может требовать корректировки")
-            elif pattern_type == "competency":
-                hints.append(f"Обнаружен документ типа '{format_name}' - проверьте соответствие компетенции")
-            elif pattern_type == "legal_term":
-                hints.append(f"Обнаружено потенциально проблемное сочетание терминов: '{match.group()}'")
-            elif pattern_type == "reference":
-                hints.append(f"Обнаружена ссылка на {format_name}: '{match.group()}'")
-
-    # Check for legal terminology consistency
-    for term_type, term_data in LEGAL_TERMS.items():
-        patterns = term_data["patterns"]
-        contexts = term_data["context"]
-        for pattern in patterns:  # type: Pattern[str]
-            for match in pattern.finditer(document_text):
-                context = document_text[max(0, match.start() - 50) : min(len(document_text), match.end() + 50)]
-                for ctx in contexts:  # type: str
-                    if ctx in context:
-                        hints.append(
-                            f"Обнаружено потенциально противоречивое сочетание терминов ({term_type}): "
-                            f"'{match.group()}' с '{ctx}' в контексте: '{context}'"
-                        )
-
-    # Check for potential email addresses with improved detection
-    email_pattern = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b")
-    for match in email_pattern.finditer(document_text):
-        email = match.group()
-        if not email.startswith(("http://", "https://", "www.")):
-            hints.append(f"Обнаружен адрес электронной почты: '{email}'")
-
-    # Check for URLs with improved protocol detection
-    url_pattern = re.compile(r'(?:https?://)?(?:www\.)?[^\s<>"]+\.[a-zA-Z]{2,}(?:/[^\s<>"]*)?')
-    for match in url_pattern.finditer(document_text):
-        url = match.group()
-        if is_url(url) and not url.startswith(("http://", "https://")):
-            hints.append(f"Обнаружен URL без указания протокола: '{url}'")
-
-    # Check for abbreviations with context
-    abbreviation_pattern = re.compile(r"\b([А-Я]{2,})\b")
-    for abbr in abbreviation_pattern.finditer(document_text):
-        if len(abbr.group()) > 2:
-            context = document_text[max(0, abbr.start() - 50) : min(len(document_text), abbr.end() + 50)]
-            hints.append(f"Обнаружена аббревиатура без расшифровки: '{abbr.group()}' в контексте: '{context}'")
-
-    return hints
+def judge_messages(document_text: str, issues: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Messages of the self-judging call for the issues found in a piece of text."""
+    user_prompt = prompts["judge_user"].format(
+        document_text=document_text, issues_json=json.dumps(issues, ensure_ascii=False, indent=2)
+    )
+    return [
+        system_message(prompts["judge_system"], settings.ai.openai_model),
+        {"role": "user", "content": user_prompt},
+    ]
 
 
 async def self_judge_issues(document_text: str, issues: list[dict[str, Any]]) -> list[dict[str, Any]]:
@@ -153,77 +84,16 @@ async def self_judge_issues(document_text: str, issues: list[dict[str, Any]]) ->
     if not issues:
         return issues
 
-    system_prompt = prompts["judge_system"]
-    user_prompt = prompts["judge_user"].format(
-        document_text=document_text, issues_json=json.dumps(issues, ensure_ascii=False, indent=2)
-    )
-
     try:
         logger.info("Self-judging issues")
-        response = await async_client.chat.completions.create(
+        response = await chat_completion(
             model=settings.ai.openai_model,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "judge_response",
-                    "schema": {
-                        "type": "object",
-                        "required": ["issues"],
-                        "additionalProperties": False,
-                        "properties": {
-                            "issues": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "required": [
-                                        "criterion",
-                                        "citation",
-                                        "explanation",
-                                        "recommendation",
-                                        "corrected_text",
-                                    ],
-                                    "additionalProperties": False,
-                                    "properties": {
-                                        "criterion": {
-                                            "type": "string",
-                                            "description": "Название критерия из списка проблем",
-                                        },
-                                        "citation": {
-                                            "type": "string",
-                                            "description": "Цитата из текста, содержащая проблему",
-                                        },
-                                        "explanation": {
-                                            "type": "string",
-                                            "description": "Объяснение, почему это является проблемой",
-                                        },
-                                        "recommendation": {
-                                            "type": "string",
-                                            "description": "Рекомендация по исправлению",
-                                        },
-                                        "corrected_text": {
-                                            "type": "string",
-                                            "description": "Исправленный вариант текста",
-                                        },
-                                    },
-                                },
-                            }
-                        },
-                    },
-                    "strict": True,
-                },
-            },
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            response_format=JUDGE_RESPONSE_FORMAT,
+            messages=judge_messages(document_text, issues),
             temperature=0.2,  # Balanced temperature for consistent improvements
+            stage="judge",
         )
-        logger.debug(response)
-        content = response.choices[0].message.content
-        if content is None:
-            raise ValueError("Received empty response from OpenAI API")
-
-        improved_issues = json.loads(content)
+        improved_issues = json.loads(response.content)
         logger.info(f"Self-judging complete. Improved {len(issues)} issues")
         return improved_issues.get("issues", [])
     except Exception as e:
@@ -231,89 +101,541 @@ async def self_judge_issues(document_text: str, issues: list[dict[str, Any]]) ->
         return issues  # Return original issues if self-judging fails
 
 
-async def analyze_document(document_text: str) -> dict[str, Any]:
-    """Analyze document using OpenAI API asynchronously."""
-    logger.info(f"Analyzing document with model: {settings.ai.openai_model}")
-    logger.info(f"Document length: {len(document_text)} characters")
+async def stream_judged_issues(document_text: str, issues: list[dict[str, Any]]) -> AsyncIterator[dict[str, Any]]:
+    """Streaming variant of `self_judge_issues`: yields every judged issue as soon as the judge has written it."""
+    if not issues:
+        return
 
-    # Generate hints from manual checks if enabled
-    if settings.ai.use_manual_hints:
-        hints = generate_manual_check_hints(document_text)
-    else:
-        logger.info("Manual check hints generation skipped as per configuration")
-        hints = []
+    parser = ArrayItemStreamParser("issues")
+    judged: list[dict[str, Any]] = []
+    try:
+        logger.info("Self-judging issues (streaming)")
+        async for delta in stream_chat_completion(
+            model=settings.ai.openai_model,
+            response_format=JUDGE_RESPONSE_FORMAT,
+            messages=judge_messages(document_text, issues),
+            temperature=0.2,  # Balanced temperature for consistent improvements
+            stage="judge",
+        ):
+            for issue in parser.feed(delta):
+                judged.append(issue)
+                yield issue
+        logger.info(f"Self-judging complete. Improved {len(issues)} issues")
+    except Exception as e:
+        logger.error(f"Error in self-judging: {str(e)}", exc_info=True)
+        # Fall back to the original issues, except the ones the judge has already returned
+        for issue in issues:
+            if _find_duplicate(judged, issue) is None:
+                yield issue
+
+
+def locate_citation(document_text: str, citation: str) -> tuple[int, int] | None:
+    """Find the span of a citation in the document, tolerating whitespace, case and "..." elisions."""
+    citation = citation.strip().strip("«»\"'")
+    if not citation:
+        return None
+    start = document_text.find(citation)
+    if start >= 0:
+        return start, start + len(citation)
+    match = re.search(r"\s+".join(re.escape(word) for word in citation.split()), document_text, re.IGNORECASE)
+    if match:
+        return match.span()
+    # Models shorten long citations with an ellipsis: anchor on the longest fragment
+    fragments = [fragment for fragment in re.split(r"\.\.\.|…", citation) if fragment.strip()]
+    if len(fragments) > 1:
+        return locate_citation(document_text, max(fragments, key=len))
+    return None
+
+
+async def judge_issues_locally(document_text: str, issues: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Self-judge issues against the text around their citations instead of the whole document.
+    Issues with overlapping windows are judged together, all groups concurrently.
+    """
+    if not issues:
+        return issues
+
+    margin = settings.ai.judge_context_chars
+    groups: list[tuple[int, int, list[int]]] = []  # window start, window end, issue indexes
+    not_located: list[int] = []
+    spans = [(i, locate_citation(document_text, issue.get("citation", ""))) for i, issue in enumerate(issues)]
+    for i, span in sorted(spans, key=lambda item: item[1] or (0, 0)):
+        if span is None:
+            not_located.append(i)
+            continue
+        start, end = max(0, span[0] - margin), min(len(document_text), span[1] + margin)
+        if groups and start <= groups[-1][1] and len(groups[-1][2]) < settings.ai.judge_group_size:
+            groups[-1] = (groups[-1][0], max(groups[-1][1], end), [*groups[-1][2], i])
+        else:
+            groups.append((start, end, [i]))
+
+    windows = [(document_text[start:end], indexes) for start, end, indexes in groups]
+    if not_located:
+        # Without a location the citations themselves are the only context
+        windows.append(("\n\n".join(issues[i].get("citation", "") for i in not_located), not_located))
+    context_chars = sum(len(text) for text, _ in windows)
+    if context_chars >= len(document_text):
+        # Issues are so dense that local windows would repeat the document
+        return await self_judge_issues(document_text, issues)
+    logger.info(
+        f"Judging {len(issues)} issues in {len(windows)} local groups: "
+        f"{context_chars} characters of context instead of {len(document_text)}"
+    )
+
+    judged = await asyncio.gather(*(self_judge_issues(text, [issues[i] for i in indexes]) for text, indexes in windows))
+    return [issue for group in judged for issue in group]
+
+
+async def judge_issues(document_text: str, issues: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Self-judge issues in the configured mode."""
+    with metrics.timer("judge"):
+        if settings.ai.judge_mode == "local":
+            return await judge_issues_locally(document_text, issues)
+        return await self_judge_issues(document_text, issues)
+
+
+def build_messages(document_text: str, hints: list[str]) -> list[dict[str, Any]]:
+    """Messages of the initial analysis call for a single piece of text."""
     hints_text = "\n".join(hints) if hints else "No additional hints."
 
     system_prompt = prompts["system"]
     user_prompt = prompts["user"].format(
         document_text=document_text, manual_check_hints=f"\nРезультаты автоматических проверок:\n{hints_text}"
     )
-
-    try:
-        logger.info("Sending request to OpenAI API")
-        response = await async_client.chat.completions.create(
+    return [
+        system_message(system_prompt, settings.ai.openai_model),
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+async def request_issues(document_text: str, hints: list[str]) -> dict[str, Any]:
+    """Run the initial analysis call for a single piece of text."""
+    logger.info("Sending request to OpenAI API")
+    with metrics.timer("prompt_build"):
+        messages = build_messages(document_text, hints)
+    with metrics.timer("initial"):
+        response = await chat_completion(
             model=settings.ai.openai_model,
             response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            messages=messages,
             temperature=settings.ai.temperature,
+            stage="initial",
         )
-        logger.info(response.usage)
-
-        content = response.choices[0].message.content
-        if content is None:
-            raise ValueError("Received empty response from OpenAI API")
+    return json.loads(response.content)
+
+
+async def stream_issues(document_text: str, hints: list[str]) -> AsyncIterator[dict[str, Any]]:
+    """Run the initial analysis call with streaming, yielding every issue as soon as it is complete."""
+    parser = ArrayItemStreamParser("issues")
+    with metrics.timer("prompt_build"):
+        messages = build_messages(document_text, hints)
+    logger.info("Sending streaming request to OpenAI API")
+    # The stage time of a stream includes the time its consumer spends on the yielded issues
+    with metrics.timer("initial"):
+        async for delta in stream_chat_completion(
+            model=settings.ai.openai_model,
+            response_format={"type": "json_object"},
+            messages=messages,
+            temperature=settings.ai.temperature,
+            stage="initial",
+        ):
+            for issue in parser.feed(delta):
+                yield issue
 
-        result = json.loads(content)
-        initial_issues = result.get("issues", [])
-        logger.info(f"Initial analysis complete. Found {len(initial_issues)} issues")
 
-        # Self-judge the issues to improve their quality if enabled
-        if settings.ai.use_judge:
-            improved_issues = await self_judge_issues(document_text, initial_issues)
-            result["issues"] = improved_issues
-            logger.info(f"Self-judging complete. Final issues count: {len(improved_issues)}")
+async def manual_check_hints(document_text: str, token_budget: int | None = None) -> list[str]:
+    """Generate hints from manual checks if enabled, within the token budget (by default from settings)."""
+    if not settings.ai.use_manual_hints:
+        logger.info("Manual check hints generation skipped as per configuration")
+        return []
+    if token_budget is not None and token_budget <= 0:
+        logger.info("Manual check hints generation skipped: no room left in the prompt")
+        return []
+    with metrics.timer("hints"):
+        return await generate_manual_check_hints_async(document_text, token_budget=token_budget)
+
+
+async def analyze_text(document_text: str, hints_token_budget: int | None = None) -> dict[str, Any]:
+    """Analyze a piece of text: manual hints, initial analysis and optional self-judging."""
+    hints = await manual_check_hints(document_text, hints_token_budget)
+    result = await request_issues(document_text, hints)
+    initial_issues = result.get("issues", [])
+    logger.info(f"Initial analysis complete. Found {len(initial_issues)} issues")
+
+    # Self-judge the issues to improve their quality if enabled
+    if settings.ai.use_judge:
+        improved_issues = await judge_issues(document_text, initial_issues)
+        result["issues"] = improved_issues
+        logger.info(f"Self-judging complete. Final issues count: {len(improved_issues)}")
+    else:
+        logger.info("Self-judging stage skipped as per configuration")
+        result["issues"] = initial_issues
+
+    result["manual_check_hints"] = hints
+    return result
+
+
+async def stream_text(document_text: str, hints_token_budget: int | None = None) -> AsyncIterator[dict[str, Any]]:
+    """Streaming variant of `analyze_text`: yields final issues as soon as they are ready."""
+    hints = await manual_check_hints(document_text, hints_token_budget)
+
+    if not settings.ai.use_judge:
+        async for issue in stream_issues(document_text, hints):
+            yield issue
+        return
+
+    margin = settings.ai.judge_context_chars
+    if settings.ai.judge_mode != "local" or len(document_text) <= 2 * margin:
+        # The full judge needs every issue at once; on a short document every local window is the whole document
+        # Judged issues are still yielded as soon as the judge has written each of them
+        initial_issues = [issue async for issue in stream_issues(document_text, hints)]
+        with metrics.timer("judge"):
+            async for issue in stream_judged_issues(document_text, initial_issues):
+                yield issue
+        return
+
+    # Judge issues locally while the initial pass is still streaming. Issues with overlapping windows are collected
+    # into one call of up to `judge_group_size`, sent once full or once the stream has moved past the window.
+    judged: asyncio.Queue[list[dict[str, Any]] | None] = asyncio.Queue()
+    judge_tasks: list[asyncio.Task[None]] = []
+    open_groups: list[tuple[int, int, list[dict[str, Any]]]] = []  # window start, window end, issues
+    not_located: list[dict[str, Any]] = []
+
+    async def judge(issues: list[dict[str, Any]]) -> None:
+        with metrics.timer("judge"):
+            result = await judge_issues_locally(document_text, issues)
+        await judged.put(result)
+
+    def send(group: tuple[int, int, list[dict[str, Any]]]) -> None:
+        open_groups.remove(group)
+        judge_tasks.append(asyncio.create_task(judge(group[2])))
+
+    def collect(issue: dict[str, Any]) -> None:
+        span = locate_citation(document_text, issue.get("citation", ""))
+        if span is None:
+            not_located.append(issue)
+            return
+        start, end = max(0, span[0] - margin), min(len(document_text), span[1] + margin)
+        # Issues come roughly in document order: no more are expected in the windows the stream has passed
+        for group in [group for group in open_groups if group[1] < start]:
+            send(group)
+        i = next((i for i, group in enumerate(open_groups) if group[0] <= end and start <= group[1]), None)
+        if i is None:
+            open_groups.append((start, end, [issue]))
+            i = len(open_groups) - 1
+        else:
+            group_start, group_end, issues = open_groups[i]
+            open_groups[i] = (min(group_start, start), max(group_end, end), [*issues, issue])
+        group = open_groups[i]
+        if len(group[2]) >= settings.ai.judge_group_size:
+            send(group)
+
+    async def produce() -> None:
+        try:
+            async for issue in stream_issues(document_text, hints):
+                collect(issue)
+            for group in list(open_groups):
+                send(group)
+            if not_located:
+                judge_tasks.append(asyncio.create_task(judge(not_located)))
+            await asyncio.gather(*judge_tasks)
+        finally:
+            await judged.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (issues := await judged.get()) is not None:
+            for issue in issues:
+                yield issue
+        await producer  # re-raise errors of the initial pass
+    finally:
+        for task in [producer, *judge_tasks]:
+            task.cancel()
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _find_duplicate(issues: list[dict[str, Any]], issue: dict[str, Any]) -> int | None:
+    """Index of an issue with the same criterion and the same or a nested citation."""
+    criterion = _normalize(issue.get("criterion", ""))
+    citation = _normalize(issue.get("citation", ""))
+    for i, existing in enumerate(issues):
+        if _normalize(existing.get("criterion", "")) != criterion:
+            continue
+        existing_citation = _normalize(existing.get("citation", ""))
+        if citation in existing_citation or existing_citation in citation:
+            return i
+    return None
+
+
+def merge_issues(document_text: str, issue_lists: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """
+    Merge issues found in overlapping chunks: drop duplicates (same criterion, same or nested citation)
+    and order the rest by the position of their citation in the document.
+    """
+    merged: list[dict[str, Any]] = []
+    for issues in issue_lists:
+        for issue in issues:
+            i = _find_duplicate(merged, issue)
+            if i is None:
+                merged.append(issue)
+            elif len(issue.get("citation", "")) > len(merged[i].get("citation", "")):
+                merged[i] = issue  # keep the more complete citation
+
+    normalized_document = _normalize(document_text)
+
+    def position(issue: dict[str, Any]) -> int:
+        found = normalized_document.find(_normalize(issue.get("citation", "")))
+        return found if found >= 0 else len(normalized_document)
+
+    return sorted(merged, key=position)
+
+
+def chunk_analyses(document_text: str, plan: AnalysisPlan) -> list[Coroutine[Any, Any, dict[str, Any]]]:
+    """Split the document into chunks and prepare their analyses, limited to `chunk_concurrency` at a time."""
+    chunks = split_document(
+        document_text,
+        max_tokens=plan.chunk_tokens,
+        overlap_tokens=settings.ai.chunk_overlap_tokens,
+        chars_per_token=plan.chars_per_token,
+    )
+    logger.info(f"Document split into {len(chunks)} chunks, concurrency: {settings.ai.chunk_concurrency}")
+    semaphore = asyncio.Semaphore(settings.ai.chunk_concurrency)
+
+    async def analyze_chunk(chunk: Chunk) -> dict[str, Any]:
+        async with semaphore:
+            logger.info(f"Analyzing chunk {chunk.index + 1}/{len(chunks)} [{chunk.start}:{chunk.end}]")
+            return await analyze_text(chunk.text, plan.hints_token_budget)
+
+    return [analyze_chunk(chunk) for chunk in chunks]
+
+
+async def analyze_chunked(document_text: str, plan: AnalysisPlan) -> dict[str, Any]:
+    """Map-reduce analysis: analyze overlapping chunks concurrently, then merge and deduplicate issues."""
+    analyses = chunk_analyses(document_text, plan)
+    results = await asyncio.gather(*analyses)
+
+    issues = merge_issues(document_text, [r.get("issues", []) for r in results])
+    logger.info(f"Chunked analysis complete. Merged {sum(len(r.get('issues', [])) for r in results)} -> {len(issues)}")
+    return {
+        "issues": issues,
+        "manual_check_hints": list(dict.fromkeys(hint for r in results for hint in r["manual_check_hints"])),
+        "chunks": len(analyses),
+    }
+
+
+async def stream_completed(
+    analyses: list[Coroutine[Any, Any, dict[str, Any]]], yielded: list[dict[str, Any]] | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Run analyses concurrently and yield the issues of each as soon as it completes, skipping duplicates of issues
+    yielded before. Analyses still running when the stream is closed, e.g. by a Streamlit rerun, are cancelled.
+    """
+    if yielded is None:
+        yielded = []
+    tasks = [asyncio.ensure_future(analysis) for analysis in analyses]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            for issue in result.get("issues", []):
+                if _find_duplicate(yielded, issue) is None:
+                    yielded.append(issue)
+                    yield issue
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_chunked(document_text: str, plan: AnalysisPlan) -> AsyncIterator[dict[str, Any]]:
+    """Streaming variant of `analyze_chunked`: yields the new issues of every chunk as soon as it is analyzed."""
+    async for issue in stream_completed(chunk_analyses(document_text, plan)):
+        yield issue
+
+
+# Issues of an analyzed document by the digest of the section their citation is in
+SectionIndex = dict[str, list[dict[str, Any]]]
+UNLOCATED = "unlocated"
+"Section index key of the issues whose citation was not found in the document, e.g. paraphrased by the model"
+
+
+def index_issues(document_text: str, issues: list[dict[str, Any]]) -> SectionIndex:
+    """Assign issues to the sections of the document, for a later incremental re-analysis of its next draft."""
+    sections = split_sections(document_text, settings.ai.incremental_section_tokens)
+    index: SectionIndex = {section.digest: [] for section in sections}
+    starts = [section.start for section in sections]
+    for issue in issues:
+        span = locate_citation(document_text, issue.get("citation", ""))
+        if span is not None and sections:
+            index[sections[max(bisect.bisect_right(starts, span[0]) - 1, 0)].digest].append(issue)
+        else:
+            index.setdefault(UNLOCATED, []).append(issue)
+    return index
+
+
+def _words(text: str) -> str:
+    words = " ".join(re.findall(r"\w+", text.casefold()))
+    return f" {words} "
+
+
+def _still_cited(document_words: str, issue: dict[str, Any]) -> bool:
+    """Whether the words of the citation still follow each other in the document, ignoring punctuation and case."""
+    words = _words(issue.get("citation", ""))
+    return words.strip() != "" and words in document_words
+
+
+async def stream_incremental(document_text: str, previous: SectionIndex) -> AsyncIterator[dict[str, Any]]:
+    """
+    Re-analyze an edited document: issues of sections unchanged since the previous analysis are reused,
+    only runs of changed sections are sent to the model. Falls back to a full analysis if most sections changed.
+    """
+    sections = split_sections(document_text, settings.ai.incremental_section_tokens)
+    changed = [section for section in sections if section.digest not in previous]
+    # Issues without a section are kept while the words of their citation are still in the document
+    document_words = _words(document_text)
+    unlocated = previous.get(UNLOCATED, [])
+    stale = sum(not _still_cited(document_words, issue) for issue in unlocated)
+    if stale or len(changed) > settings.ai.incremental_max_changed_ratio * len(sections):
+        logger.info(
+            f"{len(changed)} of {len(sections)} sections changed, {stale} of {len(unlocated)} issues without a "
+            f"section are stale, analyzing the whole document"
+        )
+        async for issue in analyze_document_stream(document_text):
+            yield issue
+        return
+
+    # Adjacent changed sections are analyzed together
+    runs: list[tuple[int, int]] = []
+    for i, section in enumerate(sections):
+        if section.digest in previous:
+            continue
+        if runs and i > 0 and sections[i - 1].digest not in previous:
+            runs[-1] = (runs[-1][0], section.end)
         else:
-            logger.info("Self-judging stage skipped as per configuration")
-            result["issues"] = initial_issues
+            runs.append((section.start, section.end))
+
+    unchanged = dict.fromkeys(section.digest for section in sections if section.digest in previous)
+    # A citation that spans an edit is stale even if its section is not
+    reused = [
+        issue
+        for digest in unchanged
+        for issue in previous[digest]
+        if locate_citation(document_text, issue.get("citation", "")) is not None
+    ] + unlocated
+    logger.info(
+        f"Incremental analysis: {len(sections) - len(changed)} of {len(sections)} sections unchanged, "
+        f"{len(reused)} issues reused; analyzing {len(runs)} changed spans, "
+        f"{sum(end - start for start, end in runs)} of {len(document_text)} characters"
+    )
+    metrics.inc("incremental_sections", len(sections) - len(changed), description="Sections by status", status="reused")
+    metrics.inc("incremental_sections", len(changed), description="Sections by status", status="analyzed")
 
-        result["manual_check_hints"] = hints
-        return result
-    except Exception as e:
-        logger.error(f"Error analyzing document: {str(e)}", exc_info=True)
-        raise
+    yielded = merge_issues(document_text, [reused])
+    for issue in yielded:
+        yield issue
 
+    semaphore = asyncio.Semaphore(settings.ai.chunk_concurrency)
 
-def is_email(text: str) -> bool:
-    """Check if text is meant to be an email address."""
-    # Check for domain patterns that suggest this should be an email
-    domain_patterns = [".ru", ".com", ".org", ".net"]
-    has_domain = any(text.endswith(pattern) for pattern in domain_patterns)
-    has_dot = "." in text
-    no_protocol = not text.startswith(("http://", "https://", "www."))
-    return has_domain and has_dot and no_protocol
+    async def analyze_run(start: int, end: int) -> dict[str, Any]:
+        async with semaphore:
+            return await analyze_document(document_text[start:end])
 
+    async for issue in stream_completed([analyze_run(start, end) for start, end in runs], yielded):
+        yield issue
 
-def is_url(text: str) -> bool:
-    """Check if text is meant to be a URL."""
-    # Check for patterns that suggest this should be a URL
-    url_indicators = ["www.", "http://", "https://", ".ru/", ".com/", ".org/", ".net/"]
-    return any(indicator in text for indicator in url_indicators)
 
+def preflight(document_text: str) -> AnalysisPlan:
+    with metrics.timer("preflight"):
+        return plan_analysis(document_text)
 
-def format_org_name(name: str) -> str:
-    """Format organization name according to rules."""
-    # Split into words and capitalize each significant word
-    words = name.split()
-    formatted_words = []
-    skip_words = {"и", "в", "на", "с", "по", "для", "при", "за", "от", "до"}
 
-    for i, word in enumerate(words):
-        if i == 0 or word.lower() not in skip_words:
-            formatted_words.append(word.capitalize())
-        else:
-            formatted_words.append(word.lower())
+async def analyze_planned(document_text: str) -> dict[str, Any]:
+    """Analyze a text in a single call or in chunks, as planned from its size."""
+    plan = preflight(document_text)
+    if plan.strategy == "chunked":
+        return await analyze_chunked(document_text, plan)
+    return await analyze_text(document_text, plan.hints_token_budget)
+
+
+def stream_planned(document_text: str) -> AsyncIterator[dict[str, Any]]:
+    """Streaming variant of `analyze_planned`; the plan is made before the first issue is awaited."""
+    plan = preflight(document_text)
+    if plan.strategy == "chunked":
+        return stream_chunked(document_text, plan)
+    return stream_text(document_text, plan.hints_token_budget)
+
+
+def span_analyses(document_text: str, spans: list[tuple[int, int]]) -> list[Coroutine[Any, Any, dict[str, Any]]]:
+    """Prepare the analyses of spans of the document, limited to `chunk_concurrency` at a time."""
+    semaphore = asyncio.Semaphore(settings.ai.chunk_concurrency)
+
+    async def analyze_span(start: int, end: int) -> dict[str, Any]:
+        async with semaphore:
+            return await analyze_planned(document_text[start:end])
+
+    return [analyze_span(start, end) for start, end in spans]
+
 
-    return " ".join(formatted_words)
+async def analyze_triaged(document_text: str) -> dict[str, Any]:
+    """
+    Triage cascade: the triage stages label the sections of the document, only the suspicious ones are analyzed
+    by the analysis model and the judge. A document found clean costs no analysis call at all.
+    """
+    triage = await triage_document(document_text)
+    if all(triage.suspicious):
+        result = await analyze_planned(document_text)
+    else:
+        results = await asyncio.gather(*span_analyses(document_text, triage.spans))
+        result = {
+            "issues": merge_issues(document_text, [r.get("issues", []) for r in results]),
+            "manual_check_hints": list(dict.fromkeys(hint for r in results for hint in r["manual_check_hints"])),
+        }
+    result["triage"] = triage.summary()
+    return result
+
+
+async def stream_triaged(document_text: str) -> AsyncIterator[dict[str, Any]]:
+    """Streaming variant of `analyze_triaged`: yields the new issues of every suspicious span as soon as it is done."""
+    triage = await triage_document(document_text)
+    if all(triage.suspicious):
+        async for issue in stream_planned(document_text):
+            yield issue
+        return
+
+    async for issue in stream_completed(span_analyses(document_text, triage.spans)):
+        yield issue
+
+
+async def analyze_document(document_text: str) -> dict[str, Any]:
+    """Analyze document using OpenAI API asynchronously."""
+    logger.info(f"Analyzing document with model: {settings.ai.openai_model}")
+    logger.info(f"Document length: {len(document_text)} characters")
+
+    try:
+        if settings.ai.triage:
+            return await analyze_triaged(document_text)
+        return await analyze_planned(document_text)
+    except Exception as e:
+        logger.error(f"Error analyzing document: {str(e)}", exc_info=True)
+        raise
+
+
+async def analyze_document_stream(document_text: str) -> AsyncIterator[dict[str, Any]]:
+    """Analyze document using OpenAI API, yielding issues as soon as they are ready."""
+    logger.info(f"Analyzing document with model: {settings.ai.openai_model} (streaming)")
+    logger.info(f"Document length: {len(document_text)} characters")
+
+    start = time.perf_counter()
+    count = 0
+    try:
+        issues = stream_triaged(document_text) if settings.ai.triage else stream_planned(document_text)
+        async for issue in issues:
+            count += 1
+            if count == 1:
+                logger.info(f"First issue after {time.perf_counter() - start:.2f}s")
+            yield issue
+    except Exception as e:
+        logger.error(f"Error analyzing document: {str(e)}", exc_info=True)
+        raise
+    logger.info(f"Streaming analysis complete. {count} issues in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,130 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from itertools import pairwise
+
+# Rough average for Russian legal text with OpenAI-style BPE tokenizers
+CHARS_PER_TOKEN = 3
+
+# Lines that open a new structural unit of a normative act: markdown headings, articles, chapters,
+# sections, numbered пункты/подпункты ("1.", "2.3.", "2.3.8") and lettered/numbered list items ("а)", "1)")
+STRUCTURE_BOUNDARY = re.compile(
+    r"^[ \t]*(?:#{1,6}\s|\**(?:Статья|Глава|Раздел)\s+[\dIVXLC]|\d+(?:\.\d+)*\.?\s|\d+\)\s|[а-я]\)\s)",
+    re.MULTILINE,
+)
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+")
+# Numbers of пункты and list items, which change when an earlier item is inserted or removed
+ENUMERATOR = re.compile(r"^[ \t]*(?:\d+(?:\.\d+)*\.?|\d+\)|[а-я]\))\s+", re.MULTILINE)
+# Once a section is long enough, it ends after a block whose digest is divisible by this number: boundaries depend on
+# the content around them only, so an edit moves at most the boundaries next to it
+SECTION_BOUNDARY_MODULUS = 4
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A window of the document text that is analyzed separately."""
+
+    index: int
+    start: int
+    "Offset of the first character in the source document"
+    end: int
+    "Offset after the last character in the source document"
+    text: str
+
+
+@dataclass(frozen=True)
+class Section:
+    """A span of structural blocks that is reused as a whole by incremental re-analysis."""
+
+    start: int
+    end: int
+    digest: str
+    "Hash of the text without numbering and whitespace differences"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate from the text length, used when no tokenizer is available."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_spans(text: str, start: int, end: int, boundary: re.Pattern[str]) -> list[tuple[int, int]]:
+    cuts = [start] + [m.start() for m in boundary.finditer(text, start, end) if start < m.start() < end] + [end]
+    return [(a, b) for a, b in pairwise(cuts) if text[a:b].strip()]
+
+
+def _blocks(text: str, start: int, end: int, max_chars: int) -> list[tuple[int, int]]:
+    """Split text[start:end] into structural blocks, each no longer than `max_chars`."""
+    blocks = []
+    for boundary in (STRUCTURE_BOUNDARY, PARAGRAPH_BOUNDARY, SENTENCE_BOUNDARY):
+        spans = _split_spans(text, start, end, boundary)
+        if len(spans) > 1:
+            break
+    else:
+        # No boundary at all: fall back to hard cuts
+        return [(a, min(a + max_chars, end)) for a in range(start, end, max_chars)]
+
+    for a, b in spans:
+        if b - a > max_chars:
+            blocks.extend(_blocks(text, a, b, max_chars))
+        else:
+            blocks.append((a, b))
+    return blocks
+
+
+def split_document(
+    text: str, max_tokens: int, overlap_tokens: int = 0, chars_per_token: float = CHARS_PER_TOKEN
+) -> list[Chunk]:
+    """
+    Split a parsed document along its structure (articles, пункты, подпункты) into windows of at most
+    `max_tokens`, each window repeating up to `overlap_tokens` of the previous one for context.
+    `chars_per_token` converts the budgets to characters, e.g. as measured by the tokenizer on the document.
+    """
+    max_chars = int(max_tokens * chars_per_token)
+    overlap_chars = int(overlap_tokens * chars_per_token)
+    if len(text) <= max_chars:
+        return [Chunk(index=0, start=0, end=len(text), text=text)]
+
+    blocks = _blocks(text, 0, len(text), max_chars)
+    chunks: list[Chunk] = []
+    first = 0
+    while first < len(blocks):
+        last = first
+        while last + 1 < len(blocks) and blocks[last + 1][1] - blocks[first][0] <= max_chars:
+            last += 1
+        start, end = blocks[first][0], blocks[last][1]
+        chunks.append(Chunk(index=len(chunks), start=start, end=end, text=text[start:end]))
+        if last + 1 >= len(blocks):
+            break
+        # Step back over trailing blocks that fit into the overlap budget, but always move forward
+        next_first = last + 1
+        while next_first - 1 > first and end - blocks[next_first - 1][0] <= overlap_chars:
+            next_first -= 1
+        first = next_first
+    return chunks
+
+
+def section_digest(text: str) -> str:
+    normalized = " ".join(ENUMERATOR.sub("", text).split())
+    return hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+
+def split_sections(text: str, min_tokens: int) -> list[Section]:
+    """
+    Split a document into sections of whole structural blocks, at least `min_tokens` long (except the last one) and
+    cut once they reach four times that. Boundaries are chosen by content, so unchanged parts of an edited document
+    keep their sections and digests.
+    """
+    min_chars = min_tokens * CHARS_PER_TOKEN
+    max_chars = 4 * min_chars
+    sections = []
+    start = None
+    blocks = _blocks(text, 0, len(text), max_chars)
+    for i, (a, b) in enumerate(blocks):
+        if start is None:
+            start = a
+        boundary = b - start >= min_chars and int(section_digest(text[a:b]), 16) % SECTION_BOUNDARY_MODULUS == 0
+        if boundary or b - start >= max_chars or i == len(blocks) - 1:
+            sections.append(Section(start=start, end=b, digest=section_digest(text[start:b])))
+            start = None
+    return sections
@@ -1,4 +1,7 @@
-from openai import AsyncOpenAI, OpenAI
+import importlib.util
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 
 from src.config import settings
 from src.logging_ import logger
@@ -10,7 +13,22 @@ client = OpenAI(
     api_key=settings.ai.openai_api_key.get_secret_value(),
 )
 
+http2 = settings.ai.http2 and importlib.util.find_spec("h2") is not None
+if settings.ai.http2 and not http2:
+    logger.warning("HTTP/2 is enabled in settings, but the 'h2' package is not installed; falling back to HTTP/1.1")
+
+# Connections are kept alive between requests, so TLS and TCP setup is paid once per connection, not per call.
+# The client must be used from a single event loop: `src.ai.loop.background_loop()` for synchronous callers.
 async_client = AsyncOpenAI(
     base_url=settings.ai.openai_base_url,
     api_key=settings.ai.openai_api_key.get_secret_value(),
+    max_retries=0,  # retries are handled by `src.ai.llm.scheduler`
+    http_client=DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.ai.http_max_connections,
+            max_keepalive_connections=settings.ai.http_max_keepalive_connections,
+            keepalive_expiry=settings.ai.http_keepalive_seconds,
+        ),
+    ),
 )
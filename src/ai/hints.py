@@ -0,0 +1,442 @@
+import asyncio
+import functools
+import multiprocessing
+import weakref
+from collections.abc import Collection, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from src.ai.nlp import NERSpan, get_nlp, morph_tags, ner_spans, preload_nlp
+from src.ai.rules import Rule, RuleEngine
+from src.ai.tokens import count_tokens
+from src.config import settings
+from src.config_schema import HintCheck
+from src.logging_ import logger
+from src.metrics import metrics
+
+NLPStage = Literal["segment", "morph", "syntax", "ner"]
+
+NLP_STAGES: tuple[NLPStage, ...] = ("segment", "morph", "syntax", "ner")
+"Natasha stages in the order they are applied"
+STAGE_DEPENDENCIES: dict[NLPStage, tuple[NLPStage, ...]] = {
+    "segment": (),
+    "morph": ("segment",),
+    "syntax": ("segment",),
+    "ner": (),  # NER tags raw text, tokens are only used to envelop spans
+}
+CHECK_STAGES: dict[HintCheck, tuple[NLPStage, ...]] = {
+    "org_names": ("ner",),
+}
+"Natasha stages each check reads; checks missing here are plain regex scans"
+
+# Legal document patterns
+LEGAL_PATTERNS: list[Rule] = [
+    # Competency patterns
+    Rule(
+        "распоряжение Правительства",
+        "competency",
+        r"\b[Рр]аспоряжение\b",
+        r"[Рр]аспоряжение\b.*\b[Пп]равительства\b",
+    ),
+    Rule("приказ Департамента", "competency", r"\b[Пп]риказ\b", r"[Пп]риказ\b.*\b[Дд]епартамента\b"),
+    Rule(
+        "постановление Администрации",
+        "competency",
+        r"\b[Пп]остановление\b",
+        r"[Пп]остановление\b.*\b[Аа]дминистрации\b",
+    ),
+    # Date patterns, the most specific first: they compete for the same position
+    Rule("DD.MM.YYYY г.", "date", r"\d{2}\.\d{2}\.\d{4}\s*г\.?"),
+    Rule("DD.MM.YYYY", "date", r"\d{2}\.\d{2}\.\d{4}"),
+    Rule("YYYY-MM-DD", "date", r"\d{4}-\d{2}-\d{2}"),
+    Rule("DD/MM/YYYY", "date", r"\d{2}/\d{2}/\d{4}"),
+    Rule("DD MM YYYY", "date", r"\d{2}\s+\d{2}\s+\d{4}"),
+    # Legal term patterns
+    Rule("negative_right", "legal_term", r"\b[Вв]праве\b", r"[Вв]праве\b.*\b[Нн]е\b"),
+    Rule("negative_obligation", "legal_term", r"\b[Оо]бязан\b", r"[Оо]бязан\b.*\b[Нн]е\b"),
+    Rule("negative_must", "legal_term", r"\b[Дд]олжен\b", r"[Дд]олжен\b.*\b[Нн]е\b"),
+    # Document reference patterns
+    Rule("point_reference", "reference", r"\b[Пп]ункт\b\s+\d+\.\d+"),
+    Rule("article_reference", "reference", r"\b[Сс]татья\b\s+\d+"),
+    Rule("subpoint_reference", "reference", r"\b[Пп]одпункт\b\s+\d+\.\d+\.\d+"),
+]
+
+# Legal terminology dictionary
+LEGAL_TERMS: dict[str, dict[str, list[str]]] = {
+    "competency": {
+        "patterns": [r"\b[Рр]аспоряжение\b", r"\b[Пп]риказ\b", r"\b[Пп]остановление\b", r"\b[Уу]каз\b"],
+        "context": ["Правительства", "Департамента", "Администрации", "Министерства"],
+    },
+    "rights": {
+        "patterns": [r"\b[Вв]праве\b", r"\b[Ии]меет право\b", r"\b[Мм]ожет\b"],
+        "context": ["не", "обязан", "должен"],
+    },
+    "obligations": {
+        "patterns": [r"\b[Оо]бязан\b", r"\b[Дд]олжен\b", r"\b[Нн]еобходимо\b"],
+        "context": ["не", "может", "вправе"],
+    },
+}
+
+RULES: list[Rule] = [
+    *LEGAL_PATTERNS,
+    *(Rule(term_type, "term", pattern) for term_type, data in LEGAL_TERMS.items() for pattern in data["patterns"]),
+    Rule("email", "email", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"),
+    # URLs start at a token boundary and never contain "@", so they do not shadow emails
+    Rule("url", "url", r'(?<![^\s<>"])(?:https?://)?(?:www\.)?[^\s<>"@]+\.[a-zA-Z]{2,}(?:/[^\s<>"]*)?'),
+    Rule("abbreviation", "abbreviation", r"\b[А-Я]{3,}\b"),
+]
+
+CHECK_KINDS: dict[HintCheck, tuple[str, ...]] = {
+    "legal_patterns": ("competency", "date", "legal_term", "reference"),
+    "legal_terms": ("term",),
+    "emails": ("email",),
+    "urls": ("url",),
+    "abbreviations": ("abbreviation",),
+}
+"Rule kinds evaluated for each check"
+
+
+@functools.cache
+def rule_engine(checks: frozenset[HintCheck]) -> RuleEngine:
+    """Combined scanner for the rules of the enabled checks, compiled once per set of checks."""
+    kinds = {kind for check in checks for kind in CHECK_KINDS.get(check, ())}
+    return RuleEngine(rule for rule in RULES if rule.kind in kinds)
+
+
+def _context(document_text: str, start: int, end: int) -> str:
+    return document_text[max(0, start - 50) : min(len(document_text), end + 50)]
+
+
+def required_stages(checks: Collection[HintCheck]) -> list[NLPStage]:
+    """Natasha stages needed to run the given checks, in execution order."""
+    needed: set[NLPStage] = set()
+    for check in checks:
+        for stage in CHECK_STAGES.get(check, ()):
+            needed.add(stage)
+            needed.update(STAGE_DEPENDENCIES[stage])
+    return [stage for stage in NLP_STAGES if stage in needed]
+
+
+def run_nlp(document_text: str, stages: Collection[NLPStage], ner: list[NERSpan] | None = None) -> Any:
+    """Build a Natasha `Doc` running only the given stages; `ner` are named entities tagged beforehand."""
+    from natasha import Doc  # type: ignore
+    from natasha.doc import DocSpan  # type: ignore
+
+    nlp = get_nlp()
+    doc = Doc(document_text)
+    for stage in stages:
+        if stage == "segment":
+            doc.segment(nlp.segmenter)
+        elif stage == "morph":
+            # Memoized by sentence, like NER
+            tags = morph_tags([[token.text for token in sent.tokens] for sent in doc.sents])
+            for sent, sent_tags in zip(doc.sents, tags, strict=True):
+                for token, (pos, feats) in zip(sent.tokens, sent_tags, strict=True):
+                    token.pos, token.feats = pos, feats
+        elif stage == "syntax":
+            doc.parse_syntax(nlp.syntax_parser)
+        elif stage == "ner":
+            if ner is None:
+                ner = ner_spans([document_text], settings.ai.ner_batch_words)[0]
+            doc.spans = [DocSpan(start, stop, type_, document_text[start:stop]) for start, stop, type_ in ner]
+            if doc.tokens is not None:
+                doc.envelop_span_tokens()
+                doc.envelop_sent_spans()
+    return doc
+
+
+@dataclass
+class Hint:
+    """A manual check finding, grouped over all its occurrences in the document."""
+
+    kind: str
+    "Finding type, e.g. 'abbreviation', 'legal_term', 'org_name'"
+    message: str
+    "Finding description, also the grouping key"
+    count: int = 0
+    "Number of occurrences in the document"
+    contexts: list[str] = field(default_factory=list)
+    "A few representative text fragments around the occurrences"
+
+    def render(self) -> str:
+        line = self.message
+        if self.count > 1:
+            line += f" (вхождений: {self.count})"
+        if self.contexts:
+            line += " в контексте: " + "; ".join(f"'{context}'" for context in self.contexts)
+        return line
+
+
+HINT_PRIORITY: dict[str, int] = {
+    "legal_term": 0,
+    "term": 1,
+    "competency": 2,
+    "org_name": 3,
+    "url": 4,
+    "email": 5,
+    "abbreviation": 6,
+    "date": 7,
+    "reference": 8,
+}
+"Usefulness of finding types for the analysis, lower is more useful"
+
+
+def collect_hints(
+    document_text: str, checks: Collection[HintCheck], max_contexts: int = 2, ner: list[NERSpan] | None = None
+) -> list[Hint]:
+    """Run manual checks and group findings by type and matched text, ranked by usefulness."""
+    grouped: dict[str, Hint] = {}
+
+    def add(kind: str, message: str, start: int | None = None, end: int | None = None) -> None:
+        hint = grouped.setdefault(message, Hint(kind=kind, message=message))
+        hint.count += 1
+        if start is not None and end is not None and len(hint.contexts) < max_contexts:
+            context = " ".join(_context(document_text, start, end).split())
+            if context not in hint.contexts:
+                hint.contexts.append(context)
+
+    # Process document with Natasha, running only the stages enabled checks need
+    stages = required_stages(checks)
+    logger.debug(f"Manual checks: {', '.join(checks)}; Natasha stages: {', '.join(stages) or 'none'}")
+    doc = run_nlp(document_text, stages, ner) if stages else None
+
+    # Check for organization names with improved formatting
+    if doc is not None and "org_names" in checks:
+        for span in doc.spans:
+            if span.type == "ORG":
+                org_name = span.text
+                formatted_name = format_org_name(org_name)
+                if org_name != formatted_name:
+                    add(
+                        "org_name",
+                        f"Обнаружено потенциально неправильное написание организации: '{org_name}' -> '{formatted_name}'",
+                    )
+
+    # Check legal patterns, terminology, emails, URLs and abbreviations in a single pass
+    for match in rule_engine(frozenset(checks)).scan(document_text):
+        rule = match.rule
+        if rule.kind == "date":
+            add(rule.kind, f"Обнаружена дата в формате {rule.name}, что может требовать корректировки")
+        elif rule.kind == "competency":
+            add(rule.kind, f"Обнаружен документ типа '{rule.name}' - проверьте соответствие компетенции")
+        elif rule.kind == "legal_term":
+            add(rule.kind, f"Обнаружено потенциально проблемное сочетание терминов: '{match.text}'")
+        elif rule.kind == "reference":
+            add(rule.kind, f"Обнаружена ссылка на {rule.name}: '{match.text}'")
+        elif rule.kind == "term":
+            # Check for legal terminology consistency
+            context = _context(document_text, match.start, match.end)
+            for ctx in LEGAL_TERMS[rule.name]["context"]:
+                if ctx in context:
+                    add(
+                        rule.kind,
+                        f"Обнаружено потенциально противоречивое сочетание терминов ({rule.name}): "
+                        f"'{match.text}' с '{ctx}'",
+                        match.start,
+                        match.end,
+                    )
+        elif rule.kind == "email" and not match.text.startswith(("http://", "https://", "www.")):
+            add(rule.kind, f"Обнаружен адрес электронной почты: '{match.text}'")
+        elif rule.kind == "url" and is_url(match.text) and not match.text.startswith(("http://", "https://")):
+            add(rule.kind, f"Обнаружен URL без указания протокола: '{match.text}'")
+        elif rule.kind == "abbreviation":
+            add(rule.kind, f"Обнаружена аббревиатура без расшифровки: '{match.text}'", match.start, match.end)
+
+    return sorted(grouped.values(), key=lambda hint: (HINT_PRIORITY.get(hint.kind, len(HINT_PRIORITY)), -hint.count))
+
+
+def generate_manual_check_hints(
+    document_text: str,
+    checks: Collection[HintCheck] | None = None,
+    token_budget: int | None = None,
+    ner: list[NERSpan] | None = None,
+) -> list[str]:
+    """Generate hints from manual checks to help LLM analysis, the most useful first, cut to the token budget."""
+    if checks is None:
+        checks = settings.ai.manual_hint_checks
+    if token_budget is None:
+        token_budget = settings.ai.manual_hints_token_budget
+
+    grouped = collect_hints(document_text, checks, max_contexts=settings.ai.manual_hints_max_contexts, ner=ner)
+    hints = []
+    used_tokens = 0
+    for hint in grouped:
+        line = hint.render()
+        tokens = count_tokens(line)
+        # A long hint that does not fit must not crowd out the shorter, less useful ones after it
+        if used_tokens + tokens > token_budget:
+            continue
+        hints.append(line)
+        used_tokens += tokens
+
+    # What the prompt would carry with one line and one context per occurrence
+    ungrouped_tokens = sum(hint.count * count_tokens(hint.message + "".join(hint.contexts[:1])) for hint in grouped)
+    logger.info(
+        f"Manual hints: {sum(hint.count for hint in grouped)} findings (~{ungrouped_tokens} tokens ungrouped) -> "
+        f"{len(grouped)} groups -> {len(hints)} hints within budget (~{used_tokens}/{token_budget} tokens)"
+    )
+    return hints
+
+
+def generate_manual_check_hints_batch(
+    texts: Sequence[str], checks: Collection[HintCheck] | None = None, token_budgets: Sequence[int | None] | None = None
+) -> list[list[str]]:
+    """`generate_manual_check_hints` for many documents, tagging the named entities of all of them in shared batches."""
+    if checks is None:
+        checks = settings.ai.manual_hint_checks
+    budgets = token_budgets if token_budgets is not None else [None] * len(texts)
+    ner: Sequence[list[NERSpan] | None] = [None] * len(texts)
+    if "ner" in required_stages(checks):
+        ner = ner_spans(texts, settings.ai.ner_batch_words)
+    return [
+        generate_manual_check_hints(text, checks, budget, ner=spans)
+        for text, budget, spans in zip(texts, budgets, ner, strict=True)
+    ]
+
+
+def _warm_up(checks: Collection[HintCheck]) -> None:
+    if required_stages(checks):
+        get_nlp()
+
+
+@functools.cache
+def hints_executor() -> Executor | None:
+    """
+    Executor generating hints for the async pipeline, per `ai.hints_executor`: a thread keeps the event loop serving
+    API calls while a document is tagged, processes also tag several documents in parallel, each loading its own
+    Natasha models. None for the event loop thread itself.
+    """
+    if settings.ai.hints_executor == "process":
+        # Spawned workers do not inherit locks held by threads of the parent, see `ConversionPool`
+        return ProcessPoolExecutor(
+            max_workers=settings.ai.hints_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+            initargs=(list(settings.ai.manual_hint_checks),),
+        )
+    if settings.ai.hints_executor == "thread":
+        return ThreadPoolExecutor(max_workers=settings.ai.hints_workers, thread_name_prefix="hints")
+    return None
+
+
+def preload_hints() -> None:
+    """Load the Natasha models where hints will be generated, in the background."""
+    executor = hints_executor()
+    if isinstance(executor, ProcessPoolExecutor):
+        for _ in range(executor._max_workers):  # type: ignore[attr-defined]
+            executor.submit(_warm_up, list(settings.ai.manual_hint_checks))
+    elif required_stages(settings.ai.manual_hint_checks):
+        preload_nlp()
+
+
+HintRequest = tuple[str, int, asyncio.Future[list[str]]]
+
+
+class HintsBatcher:
+    """
+    Collects the hint requests of concurrent analyses (batch and eval runs) for a moment and generates them with one
+    `generate_manual_check_hints_batch` call in the executor, so NER runs on full batches. Bound to one event loop.
+    """
+
+    def __init__(self, executor: Executor, max_documents: int, wait_seconds: float):
+        self.executor = executor
+        self.max_documents = max_documents
+        self.wait_seconds = wait_seconds
+        self._pending: dict[tuple[HintCheck, ...], list[HintRequest]] = {}
+        self._timers: dict[tuple[HintCheck, ...], asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def generate(self, document_text: str, checks: tuple[HintCheck, ...], token_budget: int) -> list[str]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[list[str]] = loop.create_future()
+        pending = self._pending.setdefault(checks, [])
+        pending.append((document_text, token_budget, future))
+        if len(pending) >= self.max_documents:
+            self._flush(checks)
+        elif checks not in self._timers:
+            self._timers[checks] = loop.call_later(self.wait_seconds, self._flush, checks)
+        return await future
+
+    def _flush(self, checks: tuple[HintCheck, ...]) -> None:
+        if (timer := self._timers.pop(checks, None)) is not None:
+            timer.cancel()
+        # Requests of cancelled analyses are dropped
+        batch = [request for request in self._pending.pop(checks, []) if not request[2].done()]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(checks, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, checks: tuple[HintCheck, ...], batch: list[HintRequest]) -> None:
+        metrics.observe("hints_batch_documents", len(batch), description="Documents per hint generation batch")
+        texts = [text for text, _, _ in batch]
+        budgets = [budget for _, budget, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, generate_manual_check_hints_batch, texts, list(checks), budgets
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), hints in zip(batch, results, strict=True):
+            if not future.done():
+                future.set_result(hints)
+
+
+_batchers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, HintsBatcher] = weakref.WeakKeyDictionary()
+
+
+async def generate_manual_check_hints_async(
+    document_text: str, checks: Collection[HintCheck] | None = None, token_budget: int | None = None
+) -> list[str]:
+    """`generate_manual_check_hints` in the hints executor, batched with concurrent requests of the same loop."""
+    executor = hints_executor()
+    if executor is None:
+        return generate_manual_check_hints(document_text, checks, token_budget)
+    # Resolve the defaults here: worker processes read their own settings
+    if checks is None:
+        checks = settings.ai.manual_hint_checks
+    if token_budget is None:
+        token_budget = settings.ai.manual_hints_token_budget
+    loop = asyncio.get_running_loop()
+    if (batcher := _batchers.get(loop)) is None:
+        batcher = _batchers[loop] = HintsBatcher(
+            executor, settings.ai.hints_batch_documents, settings.ai.hints_batch_wait_ms / 1000
+        )
+    return await batcher.generate(document_text, tuple(checks), token_budget)
+
+
+def is_email(text: str) -> bool:
+    """Check if text is meant to be an email address."""
+    # Check for domain patterns that suggest this should be an email
+    domain_patterns = [".ru", ".com", ".org", ".net"]
+    has_domain = any(text.endswith(pattern) for pattern in domain_patterns)
+    has_dot = "." in text
+    no_protocol = not text.startswith(("http://", "https://", "www."))
+    return has_domain and has_dot and no_protocol
+
+
+def is_url(text: str) -> bool:
+    """Check if text is meant to be a URL."""
+    # Check for patterns that suggest this should be a URL
+    url_indicators = ["www.", "http://", "https://", ".ru/", ".com/", ".org/", ".net/"]
+    return any(indicator in text for indicator in url_indicators)
+
+
+def format_org_name(name: str) -> str:
+    """Format organization name according to rules."""
+    # Split into words and capitalize each significant word
+    words = name.split()
+    formatted_words = []
+    skip_words = {"и", "в", "на", "с", "по", "для", "при", "за", "от", "до"}
+
+    for i, word in enumerate(words):
+        if i == 0 or word.lower() not in skip_words:
+            formatted_words.append(word.capitalize())
+        else:
+            formatted_words.append(word.lower())
+
+    return " ".join(formatted_words)
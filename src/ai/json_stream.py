@@ -0,0 +1,58 @@
+__all__ = ["ArrayItemStreamParser"]
+
+import json
+from typing import Any
+
+
+class ArrayItemStreamParser:
+    """
+    Incremental parser for a streamed JSON object such as `{"issues": [{...}, {...}]}`: yields every element of the
+    array under `key` as soon as the element is complete, without waiting for the rest of the document.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._in_array = False
+        self._item_start: int | None = None
+
+    def feed(self, chunk: str) -> list[Any]:
+        """Consume the next piece of the stream and return the array elements completed by it."""
+        self._text += chunk
+        items = []
+        for pos in range(self._pos, len(self._text)):
+            char = self._text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self._text[self._string_start : pos]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char in "{[":
+                if self._in_array and self._depth == 2:
+                    self._item_start = pos
+                elif char == "[" and self._depth == 1 and self._last_string == self.key:
+                    self._in_array = True
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._in_array and self._depth == 2 and self._item_start is not None:
+                    items.append(json.loads(self._text[self._item_start : pos + 1]))
+                    self._item_start = None
+                elif self._in_array and self._depth == 1:
+                    self._in_array = False
+        self._pos = len(self._text)
+        return items
@@ -0,0 +1,229 @@
+__all__ = [
+    "LLMResponse",
+    "chat_completion",
+    "count_usage",
+    "estimate_call_tokens",
+    "refresh_cache",
+    "response_cache",
+    "scheduler",
+    "stream_chat_completion",
+    "system_message",
+    "usage_totals",
+]
+
+import json
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+from src.ai.client import async_client
+from src.ai.scheduler import LLMScheduler
+from src.ai.tokens import count_tokens
+from src.cache import DiskCache, make_key
+from src.config import settings
+from src.logging_ import logger
+from src.metrics import metrics
+
+response_cache: DiskCache | None = None
+if settings.cache.enabled:
+    response_cache = DiskCache(
+        Path(settings.cache.path),
+        name="LLM response",
+        ttl=settings.cache.ttl_seconds,
+        max_size_bytes=settings.cache.max_size_mb * 1024 * 1024,
+    )
+
+refresh_cache: ContextVar[bool] = ContextVar("refresh_cache", default=False)
+"When set, cached responses are not read but replaced with fresh ones (e.g. an explicit re-run)"
+
+scheduler = LLMScheduler(
+    requests_per_minute=settings.scheduler.requests_per_minute,
+    tokens_per_minute=settings.scheduler.tokens_per_minute,
+    initial_concurrency=settings.scheduler.initial_concurrency,
+    max_concurrency=settings.scheduler.max_concurrency,
+    target_latency=settings.scheduler.target_latency_seconds,
+    max_retries=settings.scheduler.max_retries,
+    deadline=settings.scheduler.call_deadline_seconds,
+)
+"Rate limits, adaptive concurrency and retries shared by all API calls of the process; cache hits bypass it"
+
+usage_totals: Counter[str] = Counter()
+"Token usage of all API calls made by the process (local cache hits excluded), incl. provider-cached prompt tokens"
+
+
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/")
+"OpenRouter models whose providers only cache prompts marked with a `cache_control` breakpoint"
+MIN_CACHEABLE_PROMPT_TOKENS = 1024
+"Shortest prompt providers cache; a breakpoint on a shorter one is ignored"
+
+
+def system_message(content: str, model: str) -> dict[str, Any]:
+    """
+    System message for a static prompt. Static prompts go first and stay byte-identical between calls, so providers
+    can serve them from their prompt cache: OpenAI does it automatically, Anthropic and Gemini models behind
+    OpenRouter need the explicit `cache_control` breakpoint added here. Other endpoints get a plain string.
+    """
+    if (
+        settings.ai.prompt_cache_control
+        and urlparse(settings.ai.openai_base_url).hostname in ("openrouter.ai", "www.openrouter.ai")
+        and model.startswith(CACHE_CONTROL_MODEL_PREFIXES)
+        and count_tokens(content) >= MIN_CACHEABLE_PROMPT_TOKENS
+    ):
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}],
+        }
+    return {"role": "system", "content": content}
+
+
+def _message_text(message: dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content)
+
+
+def estimate_call_tokens(messages: list[dict[str, Any]]) -> int:
+    """Tokens reserved in the tokens-per-minute budget before the actual usage of a call is known."""
+    prompt = sum(count_tokens(_message_text(message)) for message in messages)
+    return prompt + settings.scheduler.completion_tokens_estimate
+
+
+def count_usage(usage: dict[str, Any], stage: str) -> None:
+    """Log and account the token usage of an API call made for a pipeline stage (e.g. 'initial', 'judge')."""
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    logger.info(
+        f"Usage ({stage}): {prompt_tokens} prompt tokens ({cached_tokens} cached), {completion_tokens} completion tokens"
+    )
+    usage_totals.update({key: value for key, value in usage.items() if isinstance(value, int)})
+    usage_totals["cached_tokens"] += cached_tokens
+    for kind, tokens in (
+        ("prompt", prompt_tokens),
+        ("cached_prompt", cached_tokens),
+        ("completion", completion_tokens),
+    ):
+        metrics.inc("llm_tokens", tokens, description="Tokens used by API calls", stage=stage, kind=kind)
+
+
+def count_call(stage: str, source: str, seconds: float | None = None) -> None:
+    metrics.inc(
+        "llm_calls", description="LLM calls by source: 'api' or the local response 'cache'", stage=stage, source=source
+    )
+    if seconds is not None:
+        metrics.observe(
+            "llm_call_seconds",
+            seconds,
+            description="Duration of API calls, including waiting for the scheduler",
+            stage=stage,
+        )
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    "Message content returned by the model"
+    usage: dict[str, Any] = field(default_factory=dict)
+    "Token usage reported by the API for the original (uncached) call"
+    cached: bool = False
+    "Whether the response was served from the local cache"
+
+
+async def chat_completion(
+    *,
+    model: str,
+    messages: list[dict[str, Any]],
+    temperature: float,
+    response_format: dict[str, Any],
+    stage: str = "other",
+) -> LLMResponse:
+    """Chat completion through the content-addressed response cache. `stage` labels the call in metrics."""
+    key = make_key(model, temperature, messages, response_format)
+    if response_cache is not None and not refresh_cache.get() and (cached := response_cache.get(key)) is not None:
+        count_call(stage, "cache")
+        return LLMResponse(**json.loads(cached), cached=True)
+
+    start = time.perf_counter()
+
+    response = await scheduler.call(
+        lambda: async_client.chat.completions.create(
+            model=model,
+            response_format=response_format,  # type: ignore[arg-type]
+            messages=messages,  # type: ignore[arg-type]
+            temperature=temperature,
+        ),
+        estimated_tokens=estimate_call_tokens(messages),
+        tokens_used=lambda response: response.usage.total_tokens if response.usage else None,
+    )
+
+    content = response.choices[0].message.content
+    if content is None:
+        raise ValueError("Received empty response from OpenAI API")
+
+    result = LLMResponse(content=content, usage=response.usage.model_dump() if response.usage else {})
+    count_call(stage, "api", time.perf_counter() - start)
+    count_usage(result.usage, stage)
+    if response_cache is not None:
+        response_cache.set(key, json.dumps({"content": result.content, "usage": result.usage}, ensure_ascii=False))
+    return result
+
+
+async def stream_chat_completion(
+    *,
+    model: str,
+    messages: list[dict[str, Any]],
+    temperature: float,
+    response_format: dict[str, Any],
+    stage: str = "other",
+) -> AsyncIterator[str]:
+    """Streaming chat completion: yields content deltas. Shares the response cache with `chat_completion`."""
+    key = make_key(model, temperature, messages, response_format)
+    if response_cache is not None and not refresh_cache.get() and (cached := response_cache.get(key)) is not None:
+        count_call(stage, "cache")
+        yield json.loads(cached)["content"]
+        return
+
+    estimated_tokens = estimate_call_tokens(messages)
+    start = time.perf_counter()
+    stream = await scheduler.call(
+        lambda: async_client.chat.completions.create(
+            model=model,
+            response_format=response_format,  # type: ignore[arg-type]
+            messages=messages,  # type: ignore[arg-type]
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        ),
+        estimated_tokens=estimated_tokens,
+    )
+    parts = []
+    usage: dict[str, Any] = {}
+    async for event in stream:
+        if event.usage is not None:
+            usage = event.usage.model_dump()
+        if event.choices and (delta := event.choices[0].delta.content):
+            if not parts:
+                time_to_first_token = time.perf_counter() - start
+                logger.info(f"Time to first token: {time_to_first_token:.2f}s")
+                metrics.observe(
+                    "llm_time_to_first_token_seconds",
+                    time_to_first_token,
+                    description="Time to the first streamed token",
+                    stage=stage,
+                )
+            parts.append(delta)
+            yield delta
+    count_call(stage, "api", time.perf_counter() - start)
+    count_usage(usage, stage)
+    scheduler.record_usage(estimated_tokens, usage.get("total_tokens"))
+
+    if not parts:
+        raise ValueError("Received empty response from OpenAI API")
+    if response_cache is not None:
+        response_cache.set(key, json.dumps({"content": "".join(parts), "usage": usage}, ensure_ascii=False))
@@ -0,0 +1,75 @@
+__all__ = ["BackgroundLoop", "background_loop"]
+
+import asyncio
+import functools
+import queue
+import threading
+from collections.abc import AsyncIterator, Coroutine, Iterator
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+from src.logging_ import logger
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class BackgroundLoop:
+    """
+    A long-lived event loop in a daemon thread, for synchronous callers such as the Streamlit script.
+
+    The async OpenAI client and its pooled keep-alive connections are bound to the loop that first used them, so all
+    API calls of a synchronous app must go through one loop that outlives single clicks. Context variables of the
+    calling thread (e.g. `llm.refresh_cache`) are visible to the submitted coroutines.
+    """
+
+    def __init__(self, name: str = "event-loop"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+        logger.info(f"Started background event loop thread '{name}'")
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        """Schedule a coroutine on the loop; the result is available through the returned future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """Run a coroutine on the loop and wait for its result; interrupting the caller cancels the coroutine."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, items: AsyncIterator[T]) -> Iterator[T]:
+        """Consume an async iterator on the loop and yield its items to the calling thread as they arrive."""
+        results: queue.Queue[Any] = queue.Queue()
+
+        async def drain() -> None:
+            try:
+                async for item in items:
+                    results.put(item)
+            except BaseException as e:
+                results.put(e)
+                raise
+            finally:
+                results.put(_DONE)
+                if hasattr(items, "aclose"):
+                    await items.aclose()
+
+        future = self.submit(drain())
+        try:
+            while (item := results.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()  # the caller stopped early, e.g. Streamlit interrupted the script
+
+
+@functools.cache
+def background_loop() -> BackgroundLoop:
+    """The process-wide background loop, started on first use."""
+    return BackgroundLoop()
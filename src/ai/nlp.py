@@ -0,0 +1,278 @@
+__all__ = [
+    "NLP_VERSION",
+    "MorphTag",
+    "NERSpan",
+    "NLPModels",
+    "get_nlp",
+    "morph_tags",
+    "ner_spans",
+    "preload_nlp",
+    "sentence_cache",
+]
+
+import bisect
+import functools
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Hashable, Iterable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from src.cache import DiskCache, LRUCache, TieredCache, make_key, package_versions
+from src.config import settings
+from src.logging_ import logger
+from src.metrics import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NERSpan = tuple[int, int, str]
+"Start, stop and type of a named entity"
+MorphTag = tuple[str, dict[str, str]]
+"Part of speech and grammatical features of a token"
+
+T = TypeVar("T", bound=Hashable)
+R = TypeVar("R")
+
+
+NLP_VERSION = package_versions("natasha", "slovnet")
+"Part of the sentence memo keys: upgrading the models invalidates memoized results"
+
+WORD = re.compile(r"\S+")
+
+# Batches of `ner_spans` are limited by words, not sentences: the tagger must not split them again
+NER_MAX_BATCH_SENTENCES = 4096
+CHARS_PER_WORD = 6
+
+
+@dataclass(frozen=True)
+class NLPModels:
+    """Natasha components shared by the whole process."""
+
+    segmenter: Any
+    morph_vocab: Any
+    emb: Any
+    morph_tagger: Any
+    syntax_parser: Any
+    ner_tagger: Any
+    load_seconds: float
+    "Cold start time: importing Natasha and loading all models"
+
+
+_lock = threading.Lock()
+_preload_started = threading.Event()
+
+
+@functools.cache
+def _load() -> NLPModels:
+    start = time.perf_counter()
+    from natasha import (  # type: ignore
+        MorphVocab,
+        NewsEmbedding,
+        NewsMorphTagger,
+        NewsNERTagger,
+        NewsSyntaxParser,
+        Segmenter,
+    )
+
+    directory = Path(settings.cache.nlp_weights_path) / NLP_VERSION if settings.cache.nlp_weights_path else None
+    emb = _share_embedding(NewsEmbedding(), directory)
+    # One model at a time, so only one extra copy of the vocabulary is alive while loading
+    ner_tagger = _share_tagger(NewsNERTagger(emb), "ner", emb, directory)
+    ner_tagger.batch_size = ner_tagger.infer.encoder.batch_size = NER_MAX_BATCH_SENTENCES
+    morph_tagger = _share_tagger(NewsMorphTagger(emb), "morph", emb, directory)
+    syntax_parser = _share_tagger(NewsSyntaxParser(emb), "syntax", emb, directory)
+    models = NLPModels(
+        segmenter=Segmenter(),
+        morph_vocab=MorphVocab(),
+        emb=emb,
+        morph_tagger=morph_tagger,
+        syntax_parser=syntax_parser,
+        ner_tagger=ner_tagger,
+        load_seconds=time.perf_counter() - start,
+    )
+    weights = f"weights memory-mapped from {directory}" if directory else "weights in process memory"
+    logger.info(f"Natasha models loaded in {models.load_seconds:.2f}s ({weights})")
+    return models
+
+
+def _mapped(array: "np.ndarray", directory: Path | None, name: str) -> "np.ndarray":
+    """
+    The array read from a read-only memory map of its copy in `directory`, written by the first process to load it:
+    every process maps the same file, so the operating system keeps one copy in the page cache for all of them.
+    """
+    if directory is None:
+        return array
+    import numpy as np
+
+    path = directory / f"{name}.npy"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so a process loading at the same time never maps a partial file
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+            np.save(f, array)
+        os.replace(f.name, path)
+    # A plain array over the mapped buffer, so the models compute exactly as with their own arrays
+    return np.asarray(np.load(path, mmap_mode="r"))
+
+
+def _share_embedding(emb: Any, directory: Path | None) -> Any:
+    """Map the quantized embedding table, ~50 MB of which the taggers only read the rows of the words they see."""
+    import numpy as np
+
+    for key, value in vars(emb.pq).items():
+        if isinstance(value, np.ndarray):
+            setattr(emb.pq, key, _mapped(value, directory, f"{emb.meta.id}.{key}"))
+    return emb
+
+
+def _share_tagger(tagger: Any, name: str, emb: Any, directory: Path | None) -> Any:
+    """
+    Map the weights of a slovnet tagger and point it to the embedding and its vocabulary: each tagger package
+    carries the same 250K words as the embedding, ~45 MB of Python objects per copy.
+    """
+    model = tagger.infer.model.strip_navec()
+    arrays, scheme = model.separate_arrays()
+    arrays = {id_: _mapped(array, directory, f"{name}.{id_}") for id_, array in arrays.items()}
+    tagger.infer.model = scheme.inject_arrays(arrays).inject_navec(emb)
+
+    vocab = tagger.infer.encoder.words_vocab
+    if vocab.items == emb.vocab.words:
+        # Same words in the same order, i.e. the same ids
+        vocab.items, vocab.item_ids = emb.vocab.words, emb.vocab.word_ids
+    return tagger
+
+
+def get_nlp() -> NLPModels:
+    """Return the process-wide Natasha models, loading them on first use."""
+    with _lock:
+        return _load()
+
+
+def preload_nlp() -> None:
+    """Start loading the models in a background thread, so the first analysis does not pay the cold start."""
+    if _preload_started.is_set():
+        return
+    _preload_started.set()
+    threading.Thread(target=get_nlp, name="natasha-preload", daemon=True).start()
+
+
+@functools.cache
+def sentence_cache() -> TieredCache:
+    """
+    NER spans and morph tags of sentences seen before: in-memory LRU in front of the optional on-disk memo, which
+    the hint workers and later runs share. Created on first use, i.e. in the process that tags.
+    """
+    disk = None
+    if settings.cache.enabled and settings.cache.nlp_path:
+        disk = DiskCache(
+            Path(settings.cache.nlp_path),
+            name="NLP sentences",
+            max_size_bytes=settings.cache.nlp_max_size_mb * 1024 * 1024,
+        )
+    return TieredCache(LRUCache("NLP sentences", max_entries=settings.cache.nlp_memory_sentences), disk)
+
+
+def _memoized(stage: str, items: Sequence[T], infer: Callable[[list[T]], Iterable[R]]) -> list[R]:
+    """
+    Results of `infer` for sentences, each distinct sentence inferred once and memoized across calls by its hash.
+    Boilerplate of normative acts (preambles, signature blocks, amendment formulas) and re-analyzed editions of
+    a document skip inference for all sentences seen before.
+    """
+    memo = sentence_cache() if settings.cache.nlp_memory_sentences > 0 else None
+    keys = [make_key(stage, NLP_VERSION, item) for item in items]
+    results: dict[str, Any] = {}
+    if memo is not None:
+        results = {key: json.loads(value) for key, value in memo.get_many(list(dict.fromkeys(keys))).items()}
+    missing = {key: item for key, item in zip(keys, items, strict=True) if key not in results}
+    if missing:
+        inferred = dict(zip(missing, infer(list(missing.values())), strict=True))
+        results.update(inferred)
+        if memo is not None:
+            memo.set_many({key: json.dumps(value, ensure_ascii=False) for key, value in inferred.items()})
+
+    memoized = len(results) - len(missing)
+    duplicates = len(items) - len(results)
+    description = (
+        "Sentences tagged by Natasha stage and source: the sentence 'memo', the 'model', "
+        "or a 'duplicate' of another sentence of the same call"
+    )
+    metrics.inc("nlp_sentences", memoized, description=description, stage=stage, source="memo")
+    metrics.inc("nlp_sentences", len(missing), description=description, stage=stage, source="model")
+    metrics.inc("nlp_sentences", duplicates, description=description, stage=stage, source="duplicate")
+    if items:
+        logger.debug(
+            f"{stage}: {memoized} of {len(results)} distinct sentences from the memo, {duplicates} repeated ones"
+        )
+    return [results[key] for key in keys]
+
+
+def _original_offset(text: str) -> Callable[[int], int]:
+    """Map an offset in `text` with whitespace runs collapsed to single spaces back to `text`."""
+    words = list(WORD.finditer(text))
+    starts = list(itertools.accumulate((len(word.group()) + 1 for word in words[:-1]), initial=0))
+
+    def original(offset: int) -> int:
+        i = bisect.bisect_right(starts, offset) - 1
+        return words[i].start() + offset - starts[i]
+
+    return original
+
+
+def _tag_ner(sentences: list[str], batch_words: int) -> list[list[NERSpan]]:
+    from slovnet.chop import chop_weighted  # type: ignore
+
+    nlp = get_nlp()
+    # Similar lengths keep the padding of a batch small
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+    spans: list[list[NERSpan]] = [[] for _ in sentences]
+    for batch in chop_weighted(order, batch_words, lambda i: len(sentences[i]) // CHARS_PER_WORD + 1):
+        for i, markup in zip(batch, nlp.ner_tagger.map([sentences[i] for i in batch]), strict=True):
+            spans[i] = [(span.start, span.stop, span.type) for span in markup.spans]
+    return spans
+
+
+def ner_spans(texts: Sequence[str], batch_words: int = 1024) -> list[list[NERSpan]]:
+    """
+    Named entities of many texts at once: the texts are split into sentences, sentences not in the memo are packed
+    into batches of about `batch_words` words for the tagger, and the spans are mapped back to their texts.
+    Many short texts gain the most: the tagger runs on a few full batches instead of one small input per text.
+    """
+    nlp = get_nlp()
+    sentences = [
+        (index, sentence.start, sentence.text)
+        for index, text in enumerate(texts)
+        for sentence in nlp.segmenter.sentenize(text)
+        if sentence.text.strip()
+    ]
+    # Line breaks of converted documents differ between editions, the tagger does not see them anyway
+    normalized = [" ".join(text.split()) for _, _, text in sentences]
+    tagged = _memoized("ner", normalized, lambda batch: _tag_ner(batch, batch_words))
+
+    spans: list[list[NERSpan]] = [[] for _ in texts]
+    for (index, offset, text), normalized_text, sentence_spans in zip(sentences, normalized, tagged, strict=True):
+        if not sentence_spans:
+            continue
+        original = _original_offset(text) if text != normalized_text else lambda position: position
+        spans[index].extend(
+            (offset + original(start), offset + original(stop - 1) + 1, type_) for start, stop, type_ in sentence_spans
+        )
+    for document_spans in spans:
+        document_spans.sort()
+    return spans
+
+
+def morph_tags(sentences: Sequence[Sequence[str]]) -> list[list[MorphTag]]:
+    """Part of speech and features of the tokens of segmented sentences, sentences not in the memo tagged at once."""
+
+    def tag(batch: list[tuple[str, ...]]) -> list[list[MorphTag]]:
+        markups = get_nlp().morph_tagger.map([list(words) for words in batch])
+        return [[(token.pos, token.feats) for token in markup.tokens] for markup in markups]
+
+    return _memoized("morph", [tuple(words) for words in sentences], tag)
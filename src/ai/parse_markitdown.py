@@ -1,16 +1,272 @@
+__all__ = [
+    "CONVERTER_VERSION",
+    "ConversionError",
+    "ConversionPool",
+    "conversion_pool",
+    "convert_file",
+    "convert_stream",
+    "markdown_cache",
+    "parse",
+    "parse_stream",
+    "spool",
+]
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import Any, BinaryIO
+
+from markitdown import MarkItDown, StreamInfo
+
+from src.cache import DiskCache, LRUCache, TieredCache, make_key, package_versions
+from src.config import settings
+from src.logging_ import logger
+from src.metrics import metrics
+
+CONVERTER_VERSION = package_versions("markitdown", "markitdown-rtf-plugin")
+"Part of the cache key: upgrading the converter invalidates converted documents"
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+@functools.cache
+def markdown_cache() -> TieredCache:
+    """Converted documents: in-memory LRU in front of the on-disk cache. Created on first use, i.e. not in workers."""
+    disk = None
+    if settings.cache.enabled:
+        disk = DiskCache(
+            Path(settings.cache.markdown_path),
+            name="Converted markdown",
+            max_size_bytes=settings.cache.markdown_max_size_mb * 1024 * 1024,
+        )
+    return TieredCache(LRUCache("Converted markdown", max_entries=settings.cache.markdown_memory_entries), disk)
+
+
+@functools.cache
+def get_markitdown() -> MarkItDown:
+    return MarkItDown(enable_plugins=True)
+
+
+def convert_file(path: Path) -> str:
+    """Convert a document to markdown in the current process, bypassing the cache."""
+    result = get_markitdown().convert(path)
+    return result.markdown
+
+
+def convert_stream(stream: BinaryIO, filename: str) -> str:
+    """Convert a document from a seekable binary stream in the current process, bypassing the cache."""
+    stream_info = StreamInfo(extension=Path(filename).suffix.lower() or None, filename=filename)
+    result = get_markitdown().convert_stream(stream, stream_info=stream_info)
+    return result.markdown
+
+
+def _convert_bytes(data: bytes, filename: str) -> str:
+    return convert_stream(io.BytesIO(data), filename)
+
+
+def _convert_spooled(path: str, filename: str) -> str:
+    with open(path, "rb") as f:
+        return convert_stream(f, filename)
+
+
+@contextlib.contextmanager
+def spool(stream: BinaryIO, suffix: str = "") -> Iterator[tuple[BinaryIO, str]]:
+    """
+    Copy a stream into a buffer that stays in memory up to `parse.spool_max_mb` and spills to a temporary file above
+    it, which worker processes can open by its name. Yields the rewound buffer and the SHA-256 of the content,
+    computed on the way; the temporary file is removed on exit.
+    """
+    # Not `tempfile.SpooledTemporaryFile`: MarkItDown's type detection only accepts `io.BufferedIOBase` streams
+    max_size = settings.parse.spool_max_mb * 1024 * 1024
+    buffer: BinaryIO = io.BytesIO()
+    digest = hashlib.sha256()
+    try:
+        while chunk := stream.read(SPOOL_CHUNK_SIZE):
+            digest.update(chunk)
+            buffer.write(chunk)
+            if isinstance(buffer, io.BytesIO) and buffer.tell() > max_size:
+                fd, path = tempfile.mkstemp(suffix=suffix)
+                os.close(fd)
+                spilled = open(path, "w+b")  # noqa: SIM115
+                spilled.write(buffer.getbuffer())
+                buffer = spilled
+        buffer.seek(0)
+        yield buffer, digest.hexdigest()
+    finally:
+        buffer.close()
+        if not isinstance(buffer, io.BytesIO):
+            os.unlink(buffer.name)
+
+
+def _digest_in_place(stream: io.BytesIO) -> str:
+    """SHA-256 of an in-memory stream, e.g. a Streamlit upload, without copying its content."""
+    with stream.getbuffer() as view:
+        return hashlib.sha256(view).hexdigest()
 
-from markitdown import MarkItDown
 
-md = MarkItDown(enable_plugins=True)
+def _file_digest(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _cached(digest: str, convert: Callable[[], str]) -> str:
+    key = make_key(CONVERTER_VERSION, digest)
+    with metrics.timer("parse"):
+        if (markdown := markdown_cache().get(key)) is not None:
+            metrics.inc("documents_parsed", description="Parsed documents by source", source="cache")
+            return markdown
+        markdown = convert()
+    markdown_cache().set(key, markdown)
+    metrics.inc("documents_parsed", description="Parsed documents by source", source="convert")
+    return markdown
 
 
 def parse(path: Path) -> str:
     """
     Parse a document and return the text content.
     """
-    result = md.convert(path)
-    return result.markdown
+    return _cached(_file_digest(path), lambda: convert_file(path))
+
+
+def parse_stream(stream: BinaryIO, filename: str) -> str:
+    """
+    Parse a document from a binary stream, e.g. an upload, without saving it under a name.
+    The extension of `filename` tells MarkItDown the document type.
+    """
+    if isinstance(stream, io.BytesIO):
+        # Already in memory, e.g. a Streamlit upload: hashed and converted in place
+        digest = _digest_in_place(stream)
+        stream.seek(0)
+        return _cached(digest, lambda: convert_stream(stream, filename))
+    with spool(stream, Path(filename).suffix) as (buffer, digest):
+        return _cached(digest, lambda: convert_stream(buffer, filename))
+
+
+class ConversionError(Exception):
+    """The document timed out or crashed the conversion worker."""
+
+
+def _warm_up() -> None:
+    get_markitdown()
+
+
+def _kill_workers(executor: ProcessPoolExecutor) -> None:
+    for process in list((executor._processes or {}).values()):  # type: ignore[attr-defined]
+        process.kill()
+
+
+class ConversionPool:
+    """
+    Converts documents in worker processes, each keeping a warm `MarkItDown` instance.
+
+    A document that runs longer than the timeout or kills its worker cannot hang or crash the caller: the workers are
+    restarted and a `ConversionError` is raised. Documents that were converted next to it at that moment are retried
+    once on the fresh workers.
+    """
+
+    def __init__(self, workers: int | None = None, timeout: float | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        # At most one document per worker is submitted, so the timeout does not include time spent in the queue
+        self._slots = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+        self._warm_up_started = threading.Event()
+        self._executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        # Spawned workers do not inherit locks held by threads of the parent (Streamlit, Natasha preload, asyncio)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return  # already restarted by another caller
+            logger.warning("Restarting document conversion workers")
+            _kill_workers(broken)
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._start()
+
+    def warm_up(self) -> None:
+        """Start all workers in the background, so the first conversion does not pay for importing MarkItDown."""
+        if self._warm_up_started.is_set():
+            return
+        self._warm_up_started.set()
+        for _ in range(self.workers):
+            self._executor.submit(_warm_up)
+
+    def convert(self, path: Path, timeout: float | None = None) -> str:
+        """Return the markdown of a document from the cache or convert it in a worker process."""
+        return _cached(_file_digest(path), lambda: self._run(convert_file, path, name=str(path), timeout=timeout))
+
+    def convert_stream(self, stream: BinaryIO, filename: str, timeout: float | None = None) -> str:
+        """
+        `parse_stream` converting in a worker process. Content already in memory, e.g. a Streamlit upload, is hashed
+        in place and passed to the worker through a pipe once. Other streams are spooled: up to `parse.spool_max_mb`
+        they are passed through the pipe, larger ones are read by the worker from the spooled file.
+        """
+        if isinstance(stream, io.BytesIO):
+            return _cached(
+                _digest_in_place(stream),
+                lambda: self._run(_convert_bytes, stream.getvalue(), filename, name=filename, timeout=timeout),
+            )
+        with spool(stream, Path(filename).suffix) as (buffer, digest):
+            if isinstance(buffer, io.BytesIO):
+                data = buffer.getvalue()
+                return _cached(
+                    digest, lambda: self._run(_convert_bytes, data, filename, name=filename, timeout=timeout)
+                )
+            return _cached(
+                digest,
+                lambda: self._run(_convert_spooled, buffer.name, filename, name=filename, timeout=timeout),
+            )
+
+    def _run(self, function: Callable[..., str], *args: Any, name: str, timeout: float | None) -> str:
+        timeout = timeout if timeout is not None else self.timeout
+        with self._slots:
+            for _ in range(2):
+                with self._lock:
+                    executor = self._executor
+                    future = executor.submit(function, *args)
+                try:
+                    return future.result(timeout)
+                except FuturesTimeoutError:
+                    self._restart(executor)
+                    raise ConversionError(f"Conversion of {name} timed out after {timeout}s") from None
+                except BrokenProcessPool:
+                    self._restart(executor)
+        raise ConversionError(f"Conversion of {name} crashed the worker process")
+
+    async def convert_async(self, path: Path, timeout: float | None = None) -> str:
+        """`convert` that does not block the event loop."""
+        return await asyncio.to_thread(self.convert, path, timeout)
+
+    async def convert_batch(self, paths: Iterable[Path], timeout: float | None = None) -> list[str | BaseException]:
+        """Convert documents concurrently; a failed document yields its exception instead of the markdown."""
+        return await asyncio.gather(*(self.convert_async(path, timeout) for path in paths), return_exceptions=True)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+
+@functools.cache
+def conversion_pool() -> ConversionPool:
+    """Process-wide conversion pool configured by the `parse` settings."""
+    return ConversionPool(workers=settings.parse.workers, timeout=settings.parse.timeout_seconds)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+__all__ = ["AnalysisPlan", "PromptTooLargeError", "plan_analysis"]
+
+import functools
+from dataclasses import dataclass
+from typing import Literal
+
+from src.ai.tokens import count_tokens
+from src.config import prompts, settings
+from src.logging_ import logger
+
+# Chat formatting tokens added per message by the API
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class PromptTooLargeError(ValueError):
+    """The document does not fit into the context window and chunking is disabled."""
+
+
+@dataclass(frozen=True)
+class AnalysisPlan:
+    """How a document is sent to the model, decided from local token counts before any API call."""
+
+    strategy: Literal["single", "trimmed_hints", "chunked"]
+    document_tokens: int
+    hints_token_budget: int
+    "Token budget of manual check hints per analysis call"
+    chunk_tokens: int
+    "Token budget of a chunk, for the 'chunked' strategy"
+    chars_per_token: float
+    "Measured on the document, to split it into chunks by characters"
+
+
+@functools.cache
+def prompt_overhead_tokens() -> int:
+    """Tokens of the initial analysis prompt without the document and the hints."""
+    user_prompt = prompts["user"].format(document_text="", manual_check_hints="")
+    return count_tokens(prompts["system"]) + count_tokens(user_prompt) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+@functools.cache
+def judge_overhead_tokens() -> int:
+    """Tokens of the judge prompt without the document and the issues."""
+    user_prompt = prompts["judge_user"].format(document_text="", issues_json="")
+    return count_tokens(prompts["judge_system"]) + count_tokens(user_prompt) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def _fits(document_tokens: int, hints_tokens: int) -> bool:
+    """Whether the initial call and, in 'full' mode, the judge call over the whole document fit the context window."""
+    reserve = settings.ai.completion_reserve_tokens
+    needed = prompt_overhead_tokens() + hints_tokens
+    if settings.ai.use_judge and settings.ai.judge_mode == "full":
+        # The judge gets the issues of the initial answer on top of the document
+        needed = max(needed, judge_overhead_tokens() + reserve)
+    return document_tokens + needed + reserve <= settings.ai.context_window_tokens
+
+
+def plan_analysis(document_text: str) -> AnalysisPlan:
+    """
+    Pick the analysis strategy from the prompt size: a single call, a single call with fewer manual hints,
+    or chunks. Raises `PromptTooLargeError` if the document fits neither way, before anything is sent.
+    """
+    document_tokens = count_tokens(document_text)
+    hints_budget = settings.ai.manual_hints_token_budget if settings.ai.use_manual_hints else 0
+    # A chunk must fit the context window with a full hints budget, whatever `chunk_max_tokens` says
+    max_chunk_tokens = (
+        settings.ai.context_window_tokens
+        - settings.ai.completion_reserve_tokens
+        - max(prompt_overhead_tokens() + hints_budget, judge_overhead_tokens() + settings.ai.completion_reserve_tokens)
+    )
+    chunk_tokens = min(settings.ai.chunk_max_tokens or max_chunk_tokens, max_chunk_tokens)
+    chars_per_token = len(document_text) / document_tokens if document_tokens else 1.0
+
+    def plan(strategy: Literal["single", "trimmed_hints", "chunked"], hints_token_budget: int) -> AnalysisPlan:
+        result = AnalysisPlan(strategy, document_tokens, hints_token_budget, chunk_tokens, chars_per_token)
+        logger.info(
+            f"Pre-flight: {len(document_text)} characters, {document_tokens} tokens "
+            f"({chars_per_token:.2f} characters per token), strategy: {strategy}, "
+            f"hints budget: {hints_token_budget} tokens"
+        )
+        return result
+
+    # Every chunk repeats the prompt and the hints and loses the context of the others, so by default only documents
+    # that do not fit the context window are chunked; `chunk_max_tokens` opts into smaller concurrent chunks
+    if settings.ai.use_chunking and settings.ai.chunk_max_tokens and document_tokens > chunk_tokens:
+        return plan("chunked", hints_budget)
+    if _fits(document_tokens, hints_budget):
+        return plan("single", hints_budget)
+    if _fits(document_tokens, 0):
+        # Give the hints whatever the document leaves free
+        free = settings.ai.context_window_tokens - settings.ai.completion_reserve_tokens
+        return plan("trimmed_hints", free - document_tokens - prompt_overhead_tokens())
+    if settings.ai.use_chunking:
+        return plan("chunked", hints_budget)
+    raise PromptTooLargeError(
+        f"The document has {document_tokens} tokens and does not fit into the context window of "
+        f"{settings.ai.context_window_tokens} tokens; enable chunking or use a model with a larger context"
+    )
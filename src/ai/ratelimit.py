@@ -0,0 +1,45 @@
+__all__ = ["TokenBucket"]
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` units per minute, holding at most one minute worth of units.
+    Waiters are served in order. `per_minute=None` disables the limit; it may be changed at runtime.
+    """
+
+    def __init__(self, per_minute: int | None = None):
+        self.per_minute = per_minute
+        self._level = float(per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.per_minute is not None:
+            self._level = min(self._level + (now - self._updated) * self.per_minute / 60, self.per_minute)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Wait until `amount` units are available and take them. Larger amounts than the capacity wait for a full
+        bucket instead of forever."""
+        if self.per_minute is None:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                needed = min(amount, self.per_minute)
+                if self._level >= needed:
+                    self._level -= amount
+                    return
+                await asyncio.sleep((needed - self._level) * 60 / self.per_minute)
+
+    def adjust(self, amount: float) -> None:
+        """Take (or give back, if negative) units without waiting, e.g. the difference between estimated and actual
+        usage. The level may go below zero: later callers then wait for the debt to be refilled."""
+        if self.per_minute is None:
+            return
+        self._refill()
+        self._level = min(self._level - amount, self.per_minute)
@@ -0,0 +1,85 @@
+__all__ = ["Rule", "RuleEngine", "RuleMatch"]
+
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+WORD_BOUNDARY = r"\b"
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A pattern rule for the single-pass scanner."""
+
+    name: str
+    "Human-readable rule name, e.g. 'приказ Департамента' or 'DD.MM.YYYY'"
+    kind: str
+    "Rule family, e.g. 'competency', 'date', 'email'"
+    trigger: str
+    "Regex found by the combined scanner; rules sharing a trigger are evaluated together"
+    pattern: str | None = None
+    """
+    Optional refinement matched at the trigger position, within its line. Matches of a rule do not overlap, and once
+    it fails the rest of the line is skipped for the rule: a pattern like `keyword.*other` that fails at one trigger
+    fails at every later one on the line, so a line with many triggers is scanned once per rule, not once per trigger
+    """
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    rule: Rule
+    start: int
+    end: int
+    text: str
+
+
+class RuleEngine:
+    """
+    Compiles all rule triggers into one alternation with named groups and scans the text once.
+
+    Matches are leftmost and non-overlapping, like a single `re.finditer`: where triggers compete for the same
+    position, the one listed first wins, so list specific triggers before generic ones.
+    """
+
+    def __init__(self, rules: Iterable[Rule], flags: int = 0):
+        self._groups: dict[str, list[tuple[Rule, re.Pattern[str] | None]]] = {}
+        group_by_trigger: dict[str, str] = {}
+        for rule in rules:
+            if rule.trigger not in group_by_trigger:
+                group_by_trigger[rule.trigger] = f"r{len(group_by_trigger)}"
+                self._groups[group_by_trigger[rule.trigger]] = []
+            refinement = re.compile(rule.pattern, flags) if rule.pattern is not None else None
+            self._groups[group_by_trigger[rule.trigger]].append((rule, refinement))
+
+        # Triggers starting with a word boundary share a single `\b` check: at most positions the scanner then
+        # fails once instead of once per keyword. The shared branch keeps the place of the first such trigger.
+        branches: list[str] = []
+        word_branches: list[str] = []
+        for trigger, group in group_by_trigger.items():
+            if trigger.startswith(WORD_BOUNDARY):
+                if not word_branches:
+                    branches.append("")  # placeholder for the shared branch
+                word_branches.append(f"(?P<{group}>{trigger.removeprefix(WORD_BOUNDARY)})")
+            else:
+                branches.append(f"(?P<{group}>{trigger})")
+        if word_branches:
+            branches[branches.index("")] = f"{WORD_BOUNDARY}(?:{'|'.join(word_branches)})"
+        self._scanner = re.compile("|".join(branches) or r"(?!)", flags)
+
+    def scan(self, text: str) -> Iterator[RuleMatch]:
+        # Position each refined rule may match from again: the end of its last match or of the line it failed on
+        resume: dict[Rule, int] = {}
+        for match in self._scanner.finditer(text):
+            group = match.lastgroup
+            assert group is not None
+            for rule, refinement in self._groups[group]:
+                if refinement is None:
+                    yield RuleMatch(rule, match.start(), match.end(), match.group())
+                elif match.start() < resume.get(rule, 0):
+                    continue
+                elif refined := refinement.match(text, match.start()):
+                    resume[rule] = refined.end()
+                    yield RuleMatch(rule, refined.start(), refined.end(), refined.group())
+                else:
+                    line_end = text.find("\n", match.start())
+                    resume[rule] = len(text) if line_end == -1 else line_end
@@ -0,0 +1,171 @@
+__all__ = ["LLMScheduler"]
+
+import asyncio
+import itertools
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import openai
+
+from src.ai.ratelimit import TokenBucket
+from src.logging_ import logger
+
+T = TypeVar("T")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth another attempt."""
+    return isinstance(error, openai.RateLimitError | openai.InternalServerError | openai.APIConnectionError)
+
+
+def retry_after(error: Exception) -> float | None:
+    """Delay requested by the server in the `Retry-After` header, in seconds."""
+    if not isinstance(error, openai.APIStatusError):
+        return None
+    try:
+        return float(error.response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+class LLMScheduler:
+    """
+    Shared admission control for LLM calls:
+
+    - token buckets for requests and tokens per minute;
+    - AIMD concurrency: the number of calls in flight grows by one per `limit` successful calls and halves on a
+      rate limit, server error, timeout or a call slower than `target_latency`;
+    - retries with full-jitter exponential backoff (or the server's `Retry-After`);
+    - a deadline per call covering waiting, all attempts and backoff.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 16,
+        target_latency: float | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        deadline: float | None = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def requests_per_minute(self) -> int | None:
+        return self.requests.per_minute
+
+    @requests_per_minute.setter
+    def requests_per_minute(self, value: int | None) -> None:
+        self.requests.per_minute = value
+
+    async def _acquire(self, estimated_tokens: int) -> float:
+        await self.requests.acquire()
+        await self.tokens.acquire(estimated_tokens)
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()  # the slot was handed over just before the cancellation
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        return time.monotonic()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots over to waiters in order; the slot is taken on their behalf."""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _increase(self) -> None:
+        self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+        self._wake()
+
+    def _decrease(self, started: float, reason: str) -> None:
+        # Calls started before the last decrease reflect the old limit: one burst halves the limit only once
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.limit / 2, 1.0)
+        logger.warning(f"LLM concurrency limit lowered to {int(self.limit)}: {reason}")
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        if (delay := retry_after(error)) is not None:
+            return delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int | None) -> None:
+        """Correct the tokens-per-minute bucket by the actual usage of a call."""
+        if used_tokens is not None:
+            self.tokens.adjust(used_tokens - estimated_tokens)
+
+    async def call(
+        self,
+        request: Callable[[], Awaitable[T]],
+        *,
+        estimated_tokens: int,
+        tokens_used: Callable[[T], int | None] = lambda _: None,
+        deadline: float | None = None,
+    ) -> T:
+        """
+        Run `request` under the limits, retrying transient errors until the deadline. For streaming requests the slot
+        covers opening the stream (time to first byte); report the usage of the stream with `record_usage`.
+        """
+        async with asyncio.timeout(deadline if deadline is not None else self.deadline):
+            for attempt in itertools.count():
+                started = await self._acquire(estimated_tokens)
+                try:
+                    result = await request()
+                except Exception as e:
+                    self._release()
+                    if not is_retryable(e):
+                        raise
+                    self._decrease(started, type(e).__name__)
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException:
+                    self._release()
+                    raise
+
+                self._release()
+                latency = time.monotonic() - started
+                if self.target_latency is not None and latency > self.target_latency:
+                    self._decrease(started, f"latency {latency:.1f}s")
+                else:
+                    self._increase()
+                self.record_usage(estimated_tokens, tokens_used(result))
+                return result
+        raise AssertionError("unreachable")
@@ -0,0 +1,48 @@
+__all__ = ["count_tokens", "encoder"]
+
+import functools
+import math
+
+import tiktoken
+
+from src.ai.chunking import estimate_tokens
+from src.config import settings
+from src.logging_ import logger
+
+# Encoding of the current OpenAI models, used for models tiktoken does not know (e.g. other providers on OpenRouter)
+DEFAULT_ENCODING = "o200k_base"
+SAMPLES = 16
+
+
+@functools.cache
+def encoder(model: str) -> tiktoken.Encoding | None:
+    """BPE encoder of a model, loaded once per process; None if its encoding files are unavailable."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model.rsplit("/", 1)[-1])
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # Encoding files are downloaded on first use, which fails offline
+        logger.warning(f"Tokenizer for {model} is not available ({e}); token counts are estimated from the text length")
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """
+    Number of tokens of `text` for the model (by default the analysis model). Texts longer than
+    `tokenizer_exact_max_chars` are counted in evenly spaced samples of the same total length and extrapolated,
+    so a megabyte document costs as much as the limit.
+    """
+    bpe = encoder(model or settings.ai.openai_model)
+    if bpe is None:
+        return estimate_tokens(text)
+    limit = settings.ai.tokenizer_exact_max_chars
+    if len(text) <= limit:
+        return len(bpe.encode_ordinary(text))
+
+    size = limit // SAMPLES
+    step = len(text) // SAMPLES
+    samples = [text[i * step : i * step + size] for i in range(SAMPLES)]
+    sampled_tokens = sum(len(tokens) for tokens in bpe.encode_ordinary_batch(samples))
+    return math.ceil(sampled_tokens * len(text) / (size * SAMPLES))
@@ -0,0 +1,231 @@
+__all__ = ["NORMATIVE_MARKERS", "Triage", "heuristic_labels", "model_labels", "triage_document"]
+
+import asyncio
+import bisect
+import functools
+import json
+import re
+from dataclasses import dataclass
+
+from src.ai.chunking import Section, split_sections
+from src.ai.hints import CHECK_KINDS, rule_engine
+from src.ai.llm import chat_completion, system_message
+from src.ai.preflight import prompt_overhead_tokens
+from src.ai.tokens import count_tokens
+from src.config import prompts, settings
+from src.logging_ import logger
+from src.metrics import metrics
+
+# Stems of the wording the analysis criteria apply to: modality, deadlines, documents and their submission,
+# procedures and decisions, requirements and vague qualifiers. A section with none of them and no match of the
+# manual check rules (dates, abbreviations, addresses, competency) is a heading, a signature block or a note.
+NORMATIVE_MARKERS = re.compile(
+    r"\b(?:"
+    + "|".join(
+        [
+            r"долж\w*",
+            r"обязан\w*",
+            r"вправе",
+            r"мо[гж]\w*",
+            r"необходим\w*",
+            r"прав[оа]\w*",
+            r"срок\w*",
+            r"течени[еи]",
+            r"д[ао]т[аыу]\w*",
+            r"дн(?:я|ей)",
+            r"момента",
+            r"позднее",
+            r"документ\w*",
+            r"заявлени\w*",
+            r"заявк\w*",
+            r"справк\w*",
+            r"копи\w*",
+            r"направ\w*",
+            r"представ\w*",
+            r"предоставл\w*",
+            r"пода\w*",
+            r"порядо?к\w*",
+            r"решени\w*",
+            r"реша\w*",
+            r"призна\w*",
+            r"определя\w*",
+            r"устанавлива\w*",
+            r"установлен\w*",
+            r"соответств\w*",
+            r"законодательств\w*",
+            r"требовани\w*",
+            r"услови\w*",
+            r"случа\w*",
+            r"отказ\w*",
+            r"возврат\w*",
+            r"субсиди\w*",
+            r"выплат\w*",
+            r"получател\w*",
+            r"заявител\w*",
+            r"утвер\w*",
+            r"уполномоченн\w*",
+            r"компетенц\w*",
+            r"полномочи\w*",
+            r"ины[ехм]\w*",
+            r"иное",
+            r"други[ехм]\w*",
+            r"своевременн\w*",
+            r"надлежащ\w*",
+            r"определ[её]нн\w*",
+        ]
+    )
+    + r")",
+    re.IGNORECASE,
+)
+# Numbered criteria of the analysis prompt, e.g. "1. **Двусмысленность формулировок**"
+CRITERION = re.compile(r"^\s*\d+\.\s+\*\*(.+?)\*\*", re.MULTILINE)
+
+TRIAGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "triage_response",
+        "schema": {
+            "type": "object",
+            "required": ["suspicious"],
+            "additionalProperties": False,
+            "properties": {
+                "suspicious": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "Номера фрагментов, которые нужно проверить",
+                }
+            },
+        },
+        "strict": True,
+    },
+}
+
+
+@dataclass(frozen=True)
+class Triage:
+    """Sections of a document labeled by the triage stages, and the spans of text left for the analysis."""
+
+    sections: list[Section]
+    suspicious: list[bool]
+    spans: list[tuple[int, int]]
+    "Runs of suspicious sections; clean gaps cheaper than a separate analysis call are analyzed with their neighbors"
+
+    def summary(self) -> dict[str, int]:
+        return {
+            "sections": len(self.sections),
+            "suspicious_sections": sum(self.suspicious),
+            "analyzed_chars": sum(end - start for start, end in self.spans),
+        }
+
+
+def heuristic_labels(document_text: str, sections: list[Section]) -> list[bool]:
+    """Local scorer: a section is suspicious if it has normative wording or a manual check rule matches in it."""
+    suspicious = [
+        NORMATIVE_MARKERS.search(document_text, section.start, section.end) is not None for section in sections
+    ]
+    starts = [section.start for section in sections]
+    for match in rule_engine(frozenset(CHECK_KINDS)).scan(document_text):
+        i = bisect.bisect_right(starts, match.start) - 1
+        if i >= 0 and match.start < sections[i].end:
+            suspicious[i] = True
+    return suspicious
+
+
+@functools.cache
+def _criteria() -> str:
+    return "\n".join(f"- {criterion}" for criterion in CRITERION.findall(prompts["system"]))
+
+
+async def _label_group(document_text: str, sections: list[Section]) -> list[bool]:
+    fragments = "\n\n".join(
+        f"[{i}]\n{document_text[section.start : section.end].strip()}" for i, section in enumerate(sections, 1)
+    )
+    try:
+        response = await chat_completion(
+            model=settings.ai.triage_model,
+            response_format=TRIAGE_RESPONSE_FORMAT,
+            messages=[
+                system_message(prompts["triage_system"].format(criteria=_criteria()), settings.ai.triage_model),
+                {"role": "user", "content": prompts["triage_user"].format(fragments=fragments)},
+            ],
+            temperature=0,
+            stage="triage",
+        )
+        suspicious = set(json.loads(response.content)["suspicious"])
+    except Exception as e:
+        logger.error(f"Error in triage, analyzing all {len(sections)} sections: {str(e)}", exc_info=True)
+        return [True] * len(sections)
+    return [i in suspicious for i in range(1, len(sections) + 1)]
+
+
+async def model_labels(document_text: str, sections: list[Section]) -> list[bool]:
+    """
+    Cheap model scorer: sections are numbered and sent to `ai.triage_model` in groups of up to `triage_group_tokens`,
+    which answers with the numbers of the suspicious ones. A failed group counts as suspicious.
+    """
+    groups: list[list[Section]] = []
+    group_tokens = 0
+    for section in sections:
+        tokens = count_tokens(document_text[section.start : section.end])
+        if not groups or group_tokens + tokens > settings.ai.triage_group_tokens:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(section)
+        group_tokens += tokens
+
+    semaphore = asyncio.Semaphore(settings.ai.chunk_concurrency)
+
+    async def label(group: list[Section]) -> list[bool]:
+        async with semaphore:
+            return await _label_group(document_text, group)
+
+    labels = await asyncio.gather(*(label(group) for group in groups))
+    return [suspicious for group_labels in labels for suspicious in group_labels]
+
+
+def _spans(document_text: str, sections: list[Section], suspicious: list[bool]) -> list[tuple[int, int]]:
+    spans: list[tuple[int, int]] = []
+    for section, flag in zip(sections, suspicious, strict=True):
+        if not flag:
+            continue
+        # Skipping a clean gap costs another call with the whole prompt
+        if spans and count_tokens(document_text[spans[-1][1] : section.start]) < prompt_overhead_tokens():
+            spans[-1] = (spans[-1][0], section.end)
+        else:
+            spans.append((section.start, section.end))
+    return spans
+
+
+async def triage_document(document_text: str) -> Triage:
+    """
+    Label the sections of a document clean or suspicious with the `ai.triage` stages, cheapest first: every stage
+    only sees the sections all previous stages found suspicious. Only suspicious sections go to the analysis model.
+    """
+    sections = split_sections(document_text, settings.ai.triage_section_tokens)
+    suspicious = [True] * len(sections)
+    with metrics.timer("triage"):
+        for stage in settings.ai.triage:
+            candidates = [i for i, flag in enumerate(suspicious) if flag]
+            if not candidates:
+                break
+            candidate_sections = [sections[i] for i in candidates]
+            if stage == "heuristic":
+                labels = heuristic_labels(document_text, candidate_sections)
+            else:
+                labels = await model_labels(document_text, candidate_sections)
+            for i, label in zip(candidates, labels, strict=True):
+                suspicious[i] = label
+            description = "Sections labeled by triage stage: 'suspicious' ones go on to the analysis"
+            metrics.inc("triage_sections", sum(labels), description=description, stage=stage, label="suspicious")
+            metrics.inc(
+                "triage_sections", len(labels) - sum(labels), description=description, stage=stage, label="clean"
+            )
+
+    triage = Triage(sections, suspicious, _spans(document_text, sections, suspicious))
+    summary = triage.summary()
+    logger.info(
+        f"Triage ({' -> '.join(settings.ai.triage)}): {summary['suspicious_sections']} of {len(sections)} sections "
+        f"suspicious, analyzing {summary['analyzed_chars']} of {len(document_text)} characters in "
+        f"{len(triage.spans)} spans"
+    )
+    return triage
@@ -0,0 +1,171 @@
+"""
+Analyze files or whole directories of acts from the command line.
+
+    uv run python -m src.batch "examples/Нормативные акты" -o results.jsonl [--concurrency 4] [--rpm 60] \
+        [--metrics metrics.prom]
+
+Documents are converted in a process pool and analyzed concurrently. Every result is appended to the JSONL output as
+soon as it is ready; documents with a successful result in the output are skipped, so an interrupted run resumes where
+it stopped.
+"""
+
+__all__ = ["collect_documents", "load_completed", "main", "run_batch"]
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, TextIO
+
+from src.ai.analyzer import analyze_document
+from src.ai.llm import scheduler, usage_totals
+from src.ai.parse_markitdown import ConversionPool
+from src.config import settings
+from src.logging_ import logger
+from src.metrics import metrics
+
+SUPPORTED_SUFFIXES = {".docx", ".pdf", ".rtf", ".txt"}
+
+
+def collect_documents(paths: list[Path]) -> list[Path]:
+    """Expand directories into the supported documents inside them, keeping the order stable."""
+    documents = []
+    for path in paths:
+        if path.is_dir():
+            documents.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in SUPPORTED_SUFFIXES))
+        else:
+            documents.append(path)
+    return list(dict.fromkeys(documents))
+
+
+def load_completed(output: Path) -> set[str]:
+    """Paths with a successful result in an existing output file; failed documents are retried."""
+    completed: set[str] = set()
+    if not output.exists():
+        return completed
+    with output.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut off by an interrupted run
+            if "error" not in record:
+                completed.add(record["path"])
+    return completed
+
+
+async def analyze_file(path: Path, pool: ConversionPool, semaphore: asyncio.Semaphore) -> dict[str, Any]:
+    """Convert a document in the process pool and analyze it once a concurrency slot is free."""
+    record: dict[str, Any] = {"path": str(path)}
+    try:
+        text = await pool.convert_async(path)
+        record["chars"] = len(text)
+        async with semaphore:
+            start = time.perf_counter()
+            result = await analyze_document(text)
+            record["seconds"] = round(time.perf_counter() - start, 2)
+        record.update(result)
+    except Exception as e:
+        logger.error(f"Failed to analyze {path}: {e}", exc_info=True)
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def write_record(out: TextIO, record: dict[str, Any]) -> None:
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+async def run_batch(
+    documents: list[Path],
+    output: Path,
+    concurrency: int,
+    parse_workers: int | None = None,
+) -> None:
+    completed = load_completed(output)
+    pending = [path for path in documents if str(path) not in completed]
+    logger.info(
+        f"{len(documents)} documents, {len(documents) - len(pending)} already analyzed, {len(pending)} to go "
+        f"(concurrency: {concurrency}, requests per minute: {scheduler.requests_per_minute or 'unlimited'})"
+    )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    analyzed = failed = 0
+    tokens_before = usage_totals["total_tokens"]
+    prompt_tokens_before = usage_totals["prompt_tokens"]
+    cached_tokens_before = usage_totals["cached_tokens"]
+    pool = ConversionPool(workers=parse_workers, timeout=settings.parse.timeout_seconds)
+    try:
+        with output.open("a", encoding="utf-8") as out:
+            for next_record in asyncio.as_completed([analyze_file(path, pool, semaphore) for path in pending]):
+                record = await next_record
+                write_record(out, record)
+                if "error" in record:
+                    failed += 1
+                    status = record["error"]
+                else:
+                    analyzed += 1
+                    status = f"{len(record['issues'])} issues in {record['seconds']}s"
+                logger.info(f"[{analyzed + failed}/{len(pending)}] {Path(record['path']).name}: {status}")
+    finally:
+        pool.shutdown()
+
+    minutes = (time.perf_counter() - start) / 60
+    tokens = usage_totals["total_tokens"] - tokens_before
+    prompt_tokens = usage_totals["prompt_tokens"] - prompt_tokens_before
+    cached_tokens = usage_totals["cached_tokens"] - cached_tokens_before
+    logger.info(
+        f"Batch complete: {analyzed} analyzed, {failed} failed in {minutes:.1f} min. "
+        f"Throughput: {analyzed / minutes if minutes else 0:.2f} documents/min, "
+        f"{tokens / minutes if minutes else 0:.0f} tokens/min ({tokens} API tokens; cache hits excluded). "
+        f"Provider prompt cache: {cached_tokens} of {prompt_tokens} prompt tokens"
+    )
+    # Counted where hints are generated, i.e. not with the 'process' hints executor
+    memoized = metrics.total("nlp_sentences", source="memo")
+    if lookups := memoized + metrics.total("nlp_sentences", source="model"):
+        duplicates = metrics.total("nlp_sentences", source="duplicate")
+        logger.info(
+            f"Sentence memo: {memoized:.0f} of {lookups:.0f} distinct sentences ({memoized / lookups:.1%}) "
+            f"not re-tagged; {duplicates:.0f} repeated sentences tagged once with their first occurrence"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analyze documents and write the results as JSON lines")
+    parser.add_argument("paths", nargs="+", type=Path, help="Documents or directories to analyze")
+    parser.add_argument("-o", "--output", type=Path, default=Path("results.jsonl"), help="JSONL file to append to")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Documents analyzed at the same time")
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=settings.scheduler.requests_per_minute,
+        help="API requests started per minute (default: scheduler.requests_per_minute from settings)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=settings.parse.workers,
+        help="Processes converting documents (default: parse.workers from settings)",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="Write stage timings and token usage of the run here: Prometheus text for *.prom, JSON otherwise",
+    )
+    args = parser.parse_args()
+
+    scheduler.requests_per_minute = args.rpm
+    documents = collect_documents(args.paths)
+    try:
+        asyncio.run(run_batch(documents, args.output, args.concurrency, args.parse_workers))
+    finally:
+        if args.metrics is not None:
+            text = metrics.to_prometheus() if args.metrics.suffix == ".prom" else metrics.to_json_text()
+            args.metrics.write_text(text, encoding="utf-8")
+            logger.info(f"Metrics written to {args.metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+__all__ = ["DiskCache", "LRUCache", "TieredCache", "make_key", "package_versions"]
+
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from src.logging_ import logger
+
+# Keys per `IN (...)` query, below the SQLite limit of host parameters
+QUERY_KEYS = 500
+
+
+def make_key(*parts: Any) -> str:
+    """Content-addressed key: SHA-256 of the JSON representation of `parts`."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def package_versions(*names: str) -> str:
+    """Installed versions of packages, "none" for missing ones, as a key part invalidated by upgrading any of them."""
+    versions = []
+    for name in names:
+        try:
+            versions.append(f"{name}={importlib.metadata.version(name)}")
+        except importlib.metadata.PackageNotFoundError:
+            versions.append(f"{name}=none")
+    return ",".join(versions)
+
+
+class DiskCache:
+    """
+    Persistent key-value cache backed by SQLite, with TTL expiry and LRU eviction under a size cap.
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, path: Path, name: str, ttl: float | None = None, max_size_bytes: int | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                logger.debug(f"{self.name} cache miss ({self.hits} hits / {self.misses} misses)")
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        logger.info(f"{self.name} cache hit ({self.hits} hits / {self.misses} misses)")
+        return row[0]
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, str]:
+        """Values of the keys found, looked up in a few queries; for many small entries, e.g. sentences."""
+        now = time.time()
+        found: dict[str, str] = {}
+        with self._lock:
+            for i in range(0, len(keys), QUERY_KEYS):
+                part = keys[i : i + QUERY_KEYS]
+                placeholders = ",".join("?" * len(part))
+                query = f"SELECT key, value, created_at FROM entries WHERE key IN ({placeholders})"
+                for key, value, created_at in self._db.execute(query, part).fetchall():
+                    if self.ttl is None or now - created_at <= self.ttl:
+                        found[key] = value
+            with self._transaction():
+                self._db.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        logger.debug(
+            f"{self.name} cache: {len(found)} of {len(keys)} keys found ({self.hits} hits / {self.misses} misses)"
+        )
+        return found
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Mapping[str, str]) -> None:
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    [(key, value, len(value.encode()), now, now) for key, value in items.items()],
+                )
+            self._evict(now)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """One transaction instead of one per statement, which `executemany` does in autocommit mode."""
+        self._db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        if self.max_size_bytes is None:
+            return
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_size_bytes:
+            return
+        # Drop least recently used entries until the cache fits into the cap
+        evicted = 0
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_size_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"{self.name} cache evicted {evicted} entries")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+
+
+class LRUCache:
+    """In-memory key-value cache holding the `max_entries` most recently used entries. Thread-safe."""
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        return value
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, str]:
+        with self._lock:
+            found = {key: self._entries[key] for key in keys if key in self._entries}
+            for key in found:
+                self._entries.move_to_end(key)
+        return found
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Mapping[str, str]) -> None:
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional `DiskCache`; disk hits are promoted to memory."""
+
+    def __init__(self, memory: LRUCache, disk: DiskCache | None = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> str | None:
+        if (value := self.memory.get(key)) is not None:
+            logger.debug(f"{self.memory.name} memory cache hit")
+            return value
+        if self.disk is not None and (value := self.disk.get(key)) is not None:
+            self.memory.set(key, value)
+        return value
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, str]:
+        found = self.memory.get_many(keys)
+        if self.disk is not None and len(found) < len(keys):
+            from_disk = self.disk.get_many([key for key in keys if key not in found])
+            self.memory.set_many(from_disk)
+            found.update(from_disk)
+        return found
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def set_many(self, items: Mapping[str, str]) -> None:
+        self.memory.set_many(items)
+        if self.disk is not None:
+            self.disk.set_many(items)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
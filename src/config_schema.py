@@ -1,8 +1,11 @@
 from pathlib import Path
+from typing import Literal
 
 import yaml
 from pydantic import BaseModel, ConfigDict, Field, SecretStr
 
+HintCheck = Literal["org_names", "legal_patterns", "legal_terms", "emails", "urls", "abbreviations"]
+
 
 class SettingBaseModel(BaseModel):
     model_config = ConfigDict(use_attribute_docstrings=True, extra="forbid")
@@ -17,10 +20,139 @@ class AISettings(SettingBaseModel):
     "Model name for OpenAI-compatible API"
     temperature: float = 0.25
     "Temperature setting for OpenAI-compatible API"
+    prompt_cache_control: bool = True
+    "Mark long static system prompts with `cache_control` for OpenRouter models that need explicit caching hints"
     use_judge: bool = True
     "Whether to use self-judging stage"
+    judge_mode: Literal["full", "local"] = "full"
+    "Judge issues against the whole document ('full') or only against the text around their citations ('local')"
+    judge_context_chars: int = 1500
+    "Characters of document text around a citation sent to the judge in 'local' mode"
+    judge_group_size: int = 5
+    "Maximum number of issues with overlapping context judged in one 'local' call"
     use_manual_hints: bool = True
     "Whether to include manual check hints in analysis"
+    manual_hint_checks: list[HintCheck] = [
+        "org_names",
+        "legal_patterns",
+        "legal_terms",
+        "emails",
+        "urls",
+        "abbreviations",
+    ]
+    "Manual checks to run; Natasha stages are only executed for the checks that need them"
+    manual_hints_token_budget: int = 1500
+    "Estimated token budget of manual check hints in the prompt; the least useful hints are cut first"
+    manual_hints_max_contexts: int = 2
+    "Number of representative text fragments shown for a repeated finding"
+    preload_nlp_models: bool = True
+    "Whether to load Natasha models in the background when the app starts (only with manual hints)"
+    hints_executor: Literal["thread", "process", "inline"] = "thread"
+    "Where hints run: 'thread' keeps the event loop free, 'process' also tags documents in parallel, 'inline' blocks it"
+    hints_workers: int | None = None
+    "Number of hint generation threads or processes; null for the executor default"
+    hints_batch_documents: int = 16
+    "Hint requests of concurrent analyses generated together, so NER runs on full batches; 1 disables batching"
+    hints_batch_wait_ms: float = 10
+    "Time a hint request waits for concurrent requests to batch with"
+    ner_batch_words: int = 1024
+    "Approximate number of words per NER inference batch"
+    use_chunking: bool = True
+    "Whether to split large documents into overlapping chunks and analyze them concurrently"
+    chunk_max_tokens: int | None = None
+    "Token budget of a single chunk; longer documents are analyzed in chunks. Null: only chunk what does not fit"
+    chunk_overlap_tokens: int = 400
+    "Estimated number of tokens repeated from the previous chunk for context"
+    chunk_concurrency: int = 4
+    "Maximum number of chunks analyzed at the same time"
+    incremental_analysis: bool = True
+    "Whether to re-analyze only the changed sections of a document whose earlier draft was analyzed in the session"
+    incremental_section_tokens: int = 600
+    "Minimum size of a section whose issues are reused as a whole by incremental re-analysis"
+    incremental_max_changed_ratio: float = 0.6
+    "Share of changed sections above which the whole document is re-analyzed"
+    triage: list[Literal["heuristic", "model"]] = []
+    "Triage stages labeling sections clean before the analysis, cheapest first; only suspicious sections are analyzed"
+    triage_model: str = "openai/gpt-4o-mini"
+    "Cheap model of the 'model' triage stage"
+    triage_section_tokens: int = 150
+    "Minimum size of a section labeled by triage"
+    triage_group_tokens: int = 8000
+    "Token budget of the sections labeled by one call of the 'model' triage stage"
+    context_window_tokens: int = 128000
+    "Context window of the model; prompts that do not fit are split into chunks or refused before sending"
+    completion_reserve_tokens: int = 4000
+    "Tokens kept free in the context window for the answer"
+    tokenizer_exact_max_chars: int = 50_000
+    "Longer texts are tokenized in evenly spaced samples"
+    http2: bool = True
+    "Whether to multiplex API requests over HTTP/2 connections (requires the 'h2' package)"
+    http_max_connections: int = 32
+    "Maximum number of open connections to the API"
+    http_max_keepalive_connections: int = 16
+    "Maximum number of idle connections kept open for reuse"
+    http_keepalive_seconds: float = 120
+    "Time an idle connection is kept open"
+
+
+class CacheSettings(SettingBaseModel):
+    enabled: bool = True
+    "Whether to cache LLM responses and converted documents on disk"
+    path: str = ".cache/llm_responses.sqlite3"
+    "Path of the LLM response cache database, relative to the working directory"
+    ttl_seconds: int | None = 7 * 24 * 60 * 60
+    "Time after which a cached response expires; null to keep responses until evicted"
+    max_size_mb: int = 256
+    "Size cap of the cache; least recently used responses are evicted above it"
+    markdown_path: str = ".cache/markdown.sqlite3"
+    "Path of the cache of converted documents, keyed by file content and converter version"
+    markdown_max_size_mb: int = 512
+    "Size cap of the converted documents cache; least recently used documents are evicted above it"
+    markdown_memory_entries: int = 32
+    "Number of converted documents kept in memory in front of the on-disk cache (also when it is disabled)"
+    nlp_memory_sentences: int = 100_000
+    "Number of sentences whose NER spans and morph tags are memoized in memory; 0 disables the memo"
+    nlp_path: str | None = ".cache/nlp.sqlite3"
+    "Path of the on-disk memo of sentences, shared by processes and runs; null keeps the memo in memory only"
+    nlp_max_size_mb: int = 128
+    "Size cap of the on-disk memo of sentences; least recently used sentences are evicted above it"
+    nlp_weights_path: str | None = ".cache/natasha"
+    "Directory Natasha weights are unpacked to once and memory-mapped from by every process; null for private copies"
+
+
+class SchedulerSettings(SettingBaseModel):
+    requests_per_minute: int | None = None
+    "Maximum number of API requests started per minute by the process; null for no limit"
+    tokens_per_minute: int | None = None
+    "Maximum number of tokens (prompt and completion) per minute; null for no limit"
+    completion_tokens_estimate: int = 2000
+    "Completion tokens reserved for a call until its actual usage is known"
+    initial_concurrency: int = 4
+    "Number of API calls in flight at start; it grows while calls succeed and halves on overload"
+    max_concurrency: int = 16
+    "Upper bound of API calls in flight"
+    target_latency_seconds: float | None = 120
+    "Calls slower than this count as overload and lower the concurrency; null to adapt to errors only"
+    max_retries: int = 5
+    "Retries of a call after rate limits, server errors, timeouts and connection errors"
+    call_deadline_seconds: float | None = 600
+    "Time limit of a single call including waiting for a slot, retries and backoff; null for no limit"
+
+
+class ParseSettings(SettingBaseModel):
+    workers: int | None = None
+    "Number of document conversion processes; null for the number of CPUs"
+    timeout_seconds: float | None = 120
+    "Time after which the conversion of a single document is aborted; null for no limit"
+    spool_max_mb: int = 32
+    "Streamed documents not already in memory are buffered in it up to this size, larger ones in a temporary file"
+
+
+class UISettings(SettingBaseModel):
+    diff_timeout_seconds: float = 0.05
+    "Time limit of a single diff of a citation and its corrected text; after it the diff is coarser but still valid"
+    diff_cache_entries: int = 4096
+    "Number of rendered diffs kept in memory, so reruns of the Streamlit script do not diff again"
 
 
 class Settings(SettingBaseModel):
@@ -29,6 +161,14 @@ class Settings(SettingBaseModel):
     schema_: str = Field(None, alias="$schema")
     ai: AISettings
     "AI settings"
+    cache: CacheSettings = CacheSettings()
+    "LLM response and converted document cache settings"
+    scheduler: SchedulerSettings = SchedulerSettings()
+    "Rate limits, adaptive concurrency and retries of API calls"
+    parse: ParseSettings = ParseSettings()
+    "Document conversion settings"
+    ui: UISettings = UISettings()
+    "Web interface settings"
 
     @classmethod
     def from_yaml(cls, path: Path) -> "Settings":
@@ -0,0 +1,126 @@
+__all__ = ["Metrics", "metrics"]
+
+import json
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any
+
+PREFIX = "pedantic_lawyer_"
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Summary:
+    """Count, sum and maximum of observed values, e.g. durations in seconds."""
+
+    count: int = 0
+    sum: float = 0.0
+    max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Process-wide registry of counters and summaries with labels, exported as Prometheus text or JSON.
+    Thread-safe; meant for a handful of series per pipeline stage, not for high-cardinality labels.
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._summaries: dict[str, dict[Labels, Summary]] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, *, description: str = "", **labels: Any) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+            self._help.setdefault(name, description)
+
+    def observe(self, name: str, value: float, *, description: str = "", **labels: Any) -> None:
+        with self._lock:
+            self._summaries.setdefault(name, {}).setdefault(_labels(labels), Summary()).observe(value)
+            self._help.setdefault(name, description)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Observe the wall-clock duration of a pipeline stage, also when it fails."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe("stage_seconds", duration, description="Wall-clock time of pipeline stages", stage=stage)
+
+    def total(self, name: str, **labels: Any) -> float:
+        """Sum of the series of a counter having the given labels, e.g. `total("llm_calls", source="cache")`."""
+        wanted = set(_labels(labels))
+        with self._lock:
+            return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "summaries": {
+                    name: [{"labels": dict(labels), **asdict(summary)} for labels, summary in series.items()]
+                    for name, series in self._summaries.items()
+                },
+            }
+
+    def to_json_text(self) -> str:
+        return json.dumps(self.to_json(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format; a summary is exported as `_count` and `_sum` plus a `_max` gauge."""
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                full_name = f"{PREFIX}{name}_total"
+                lines += [f"# HELP {full_name} {self._help[name]}", f"# TYPE {full_name} counter"]
+                lines += [f"{full_name}{_format_labels(labels)} {value:g}" for labels, value in series.items()]
+            for name, series in self._summaries.items():
+                full_name = f"{PREFIX}{name}"
+                lines += [f"# HELP {full_name} {self._help[name]}", f"# TYPE {full_name} summary"]
+                for labels, summary in series.items():
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {summary.count}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {summary.sum:g}")
+                lines += [f"# HELP {full_name}_max Maximum of {name}", f"# TYPE {full_name}_max gauge"]
+                lines += [
+                    f"{full_name}_max{_format_labels(labels)} {summary.max:g}" for labels, summary in series.items()
+                ]
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
@@ -1,6 +1,8 @@
 import streamlit as st
 from humanfriendly.text import dedent
 
+from src.metrics import Metrics
+
 
 def apply_custom_styles():
     """Apply custom CSS styles to the Streamlit app."""
@@ -117,3 +119,67 @@ def render_issue(issue, index, highlight_differences_func):
     )
 
     st.markdown(markdown_html, unsafe_allow_html=True)
+
+
+def render_issues(issues, highlight_differences_func):
+    """Render a finished list of issues with a header, or a success message if there are none."""
+    if not issues:
+        st.success("Проблемных мест в документе не обнаружено!")
+        return
+    st.subheader(f"Обнаружено проблемных мест: {len(issues)}")
+    for index, issue in enumerate(issues, 1):
+        render_issue(issue, index, highlight_differences_func)
+
+
+def render_metrics_panel(metrics: Metrics):
+    """Sidebar summary of stage timings, LLM calls and token usage, with Prometheus and JSON downloads."""
+    data = metrics.to_json()
+    with st.sidebar.expander("Метрики", expanded=False):
+        st.caption("Накоплено процессом приложения с момента запуска, по всем сессиям")
+        stages = data["summaries"].get("stage_seconds", [])
+        if not stages:
+            st.info("Данных пока нет")
+            return
+        st.markdown("**Этапы, с**")
+        st.table(
+            [
+                {
+                    "Этап": series["labels"]["stage"],
+                    "Вызовов": series["count"],
+                    "Всего": round(series["sum"], 2),
+                    "Среднее": round(series["sum"] / series["count"], 2),
+                    "Максимум": round(series["max"], 2),
+                }
+                for series in sorted(stages, key=lambda series: -series["sum"])
+            ]
+        )
+        if calls := data["counters"].get("llm_calls"):
+            st.markdown("**Вызовы LLM**")
+            st.table(
+                [
+                    {
+                        "Этап": series["labels"]["stage"],
+                        "Источник": series["labels"]["source"],
+                        "Вызовов": series["value"],
+                    }
+                    for series in calls
+                ]
+            )
+        if tokens := data["counters"].get("llm_tokens"):
+            by_stage: dict[str, dict[str, int]] = {}
+            for series in tokens:
+                by_stage.setdefault(series["labels"]["stage"], {})[series["labels"]["kind"]] = int(series["value"])
+            st.markdown("**Токены**")
+            st.table(
+                [
+                    {
+                        "Этап": stage,
+                        "Запрос": kinds.get("prompt", 0),
+                        "Из кэша провайдера": kinds.get("cached_prompt", 0),
+                        "Ответ": kinds.get("completion", 0),
+                    }
+                    for stage, kinds in by_stage.items()
+                ]
+            )
+        st.download_button("Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        st.download_button("JSON", metrics.to_json_text(), file_name="metrics.json", mime="application/json")
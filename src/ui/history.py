@@ -0,0 +1,58 @@
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+import streamlit as st
+
+from src.ai.analyzer import SectionIndex
+from src.ai.chunking import split_sections
+from src.config import settings
+from src.ui.components import render_issues
+
+HISTORY_KEY = "analysis_history"
+
+
+@dataclass
+class AnalysisRecord:
+    """Result of one analysis, kept for the rest of the session."""
+
+    title: str
+    "Document name shown in the history"
+    issues: list[dict[str, Any]]
+    model: str
+    created_at: datetime
+    sections: SectionIndex = field(default_factory=dict)
+    "Issues by section digest, reused when an edited draft of the document is analyzed"
+
+
+def document_key(document_text: str) -> str:
+    return hashlib.sha256(document_text.encode()).hexdigest()
+
+
+def analysis_history() -> dict[str, AnalysisRecord]:
+    """Analyses of this session by document hash; survives reruns, so showing a result never calls the API."""
+    return st.session_state.setdefault(HISTORY_KEY, {})
+
+
+def closest_analysis(history: dict[str, AnalysisRecord], document_text: str) -> AnalysisRecord | None:
+    """The analysis of the session with the most sections in common with the document, e.g. of its previous draft."""
+    digests = {section.digest for section in split_sections(document_text, settings.ai.incremental_section_tokens)}
+    candidates = [record for record in history.values() if record.model == settings.ai.openai_model]
+    best = max(candidates, key=lambda record: len(digests & record.sections.keys()), default=None)
+    if best is None or not digests & best.sections.keys():
+        return None
+    return best
+
+
+def render_history(history: dict[str, AnalysisRecord], current_key: str | None, highlight_differences_func) -> None:
+    """Panel with the earlier analyses of the session, newest first; the current document is shown separately."""
+    previous = [(key, record) for key, record in history.items() if key != current_key]
+    if not previous:
+        return
+    st.subheader("История анализов")
+    for _, record in sorted(previous, key=lambda item: item[1].created_at, reverse=True):
+        label = f"{record.title} — {record.created_at:%H:%M:%S}, проблемных мест: {len(record.issues)}"
+        with st.expander(label, expanded=False):
+            st.caption(f"Модель: {record.model}")
+            render_issues(record.issues, highlight_differences_func)
@@ -1,18 +1,28 @@
-import asyncio
-import os
+from datetime import datetime
 from pathlib import Path
 
 import streamlit as st
 
-from src.ai.analyzer import analyze_document
-from src.ai.parse_markitdown import parse
+from src.ai.analyzer import analyze_document_stream, index_issues, stream_incremental
+from src.ai.hints import preload_hints
+from src.ai.llm import refresh_cache
+from src.ai.loop import background_loop
+from src.ai.parse_markitdown import conversion_pool
+from src.config import settings
 from src.logging_ import logger
-from src.ui.components import apply_custom_styles, render_issue
+from src.metrics import metrics
+from src.ui.components import apply_custom_styles, render_issue, render_issues, render_metrics_panel
 from src.ui.diff import highlight_differences
+from src.ui.history import AnalysisRecord, analysis_history, closest_analysis, document_key, render_history
 
 # Configure logging
 logger.info("Starting Pedantic Lawyer application")
 
+# Warm up Natasha models and document conversion workers while the user picks a document
+if settings.ai.use_manual_hints and settings.ai.preload_nlp_models:
+    preload_hints()
+conversion_pool().warm_up()
+
 # Set page configuration
 st.set_page_config(
     page_title="Pedantic Lawyer - Анализатор документов ЯНАО",
@@ -66,6 +76,8 @@ with st.sidebar:
 
 # Main content
 document_text = None
+document_title = None
+current_key = None
 
 # Handle different input methods
 if input_method == "Вставить текст":
@@ -75,33 +87,23 @@ if input_method == "Вставить текст":
         placeholder="Вставьте сюда текст нормативного правового акта...",
     )
     if document_text:
+        document_title = f"Текст ({len(document_text)} символов)"
         st.success("Текст готов к анализу")
         logger.info(f"Text input received, length: {len(document_text)} characters")
 
 elif input_method == "Загрузить файл" and uploaded_file is not None:
     with st.spinner("Обработка загруженного документа..."):
-        logger.info(f"Processing uploaded file: {uploaded_file.name}")
-        # Save uploaded file temporarily
-        temp_path = Path(f"temp_{uploaded_file.name}")
-        with open(temp_path, "wb") as f:
-            file_content = uploaded_file.getvalue()
-            logger.info(f"File size: {len(file_content)} bytes")
-            f.write(file_content)
-
+        logger.info(f"Processing uploaded file: {uploaded_file.name}, size: {uploaded_file.size} bytes")
         try:
-            # Parse document
-            logger.info(f"Parsing document: {temp_path}")
-            document_text = parse(temp_path)
+            # Parse the upload from memory: no temporary files in the working directory
+            uploaded_file.seek(0)
+            document_text = conversion_pool().convert_stream(uploaded_file, uploaded_file.name)
+            document_title = uploaded_file.name
             logger.info(f"Document parsed successfully: {len(document_text)} characters")
             st.success("Документ успешно загружен и обработан")
         except Exception as e:
             logger.error(f"Error processing document: {str(e)}", exc_info=True)
             st.error(f"Ошибка при обработке документа: {str(e)}")
-        finally:
-            # Clean up temporary file
-            if temp_path.exists():
-                logger.info(f"Removing temporary file: {temp_path}")
-                os.remove(temp_path)
 
 elif (
     input_method == "Использовать пример"
@@ -113,7 +115,8 @@ elif (
         logger.info(f"Processing example file: {selected_example}")
         try:
             logger.info(f"Parsing example document: {example_path}")
-            document_text = parse(example_path)
+            document_text = conversion_pool().convert(example_path)
+            document_title = selected_example
             logger.info(f"Example document parsed successfully: {len(document_text)} characters")
             st.success(f"Пример документа '{selected_example}' успешно загружен")
         except Exception as e:
@@ -143,38 +146,71 @@ if document_text:
             logger.info("Download button added for original document (example file)")
         st.text_area("Содержимое документа", document_text, height=300, disabled=True)
 
-    # Analyze button
-    if st.button("Анализировать документ", type="primary"):
-        logger.info("Analyze button clicked")
+    # Results are kept per document for the session: reruns (expanding the preview, downloads) show them again
+    # without calling the API, only the explicit re-run does
+    history = analysis_history()
+    current_key = document_key(document_text)
+    stored = history.get(current_key)
+    if stored is None:
+        run_analysis = st.button("Анализировать документ", type="primary")
+    else:
+        run_analysis = st.button("Повторить анализ", type="primary", help="Запросить новый анализ, не используя кэш")
+
+    if run_analysis:
+        logger.info("Re-run button clicked" if stored else "Analyze button clicked")
         with st.spinner("Анализ документа..."):
+            # A re-run must not return the cached responses of the previous run
+            refresh_token = refresh_cache.set(stored is not None)
             try:
-                # Run async function in a synchronous context
-                result = asyncio.run(analyze_document(document_text))
-
-                if result and "issues" in result:
-                    issues = result["issues"]
-
-                    if not issues:
-                        logger.info("No issues found in document")
-                        st.success("Проблемных мест в документе не обнаружено!")
-                    else:
-                        logger.info(f"Found {len(issues)} issues in document")
-                        st.subheader(f"Обнаружено проблемных мест: {len(issues)}")
-
-                        for i, issue in enumerate(issues, 1):
-                            logger.info(f"Issue {i}: {issue.get('criterion', 'Unknown')}")
-                            render_issue(issue, i, highlight_differences)
-
-                elif result:
-                    logger.warning(f"Unexpected API response format: {result}")
-                    st.warning("Неожиданный формат ответа от API")
-                    st.json(result)
+                # An edited draft of a document analyzed earlier: only its changed sections go to the model
+                previous = None
+                if stored is None and settings.ai.incremental_analysis:
+                    previous = closest_analysis(history, document_text)
+                if previous is not None:
+                    logger.info(f"Reusing the analysis of '{previous.title}' for unchanged sections")
+                    st.caption(f"Результаты для неизменённых разделов взяты из анализа «{previous.title}»")
+                    issue_stream = stream_incremental(document_text, previous.sections)
+                else:
+                    issue_stream = analyze_document_stream(document_text)
+
+                # Render every issue as soon as the analyzer yields it
+                header = st.empty()
+                issues = []
+                for issue in background_loop().iterate(issue_stream):
+                    issues.append(issue)
+                    logger.info(f"Issue {len(issues)}: {issue.get('criterion', 'Unknown')}")
+                    header.subheader(f"Обнаружено проблемных мест: {len(issues)}")
+                    with metrics.timer("render"):
+                        render_issue(issue, len(issues), highlight_differences)
+
+                if not issues:
+                    logger.info("No issues found in document")
+                    st.success("Проблемных мест в документе не обнаружено!")
+                else:
+                    logger.info(f"Found {len(issues)} issues in document")
+                history[current_key] = AnalysisRecord(
+                    title=document_title or "Документ",
+                    issues=issues,
+                    model=settings.ai.openai_model,
+                    created_at=datetime.now(),
+                    sections=index_issues(document_text, issues),
+                )
             except Exception as e:
                 st.error(f"Ошибка при анализе документа: {str(e)}")
+            finally:
+                refresh_cache.reset(refresh_token)
+    elif stored is not None:
+        logger.info(f"Showing stored analysis from {stored.created_at:%H:%M:%S}")
+        st.caption(f"Результаты анализа от {stored.created_at:%H:%M:%S} (модель: {stored.model})")
+        with metrics.timer("render"):
+            render_issues(stored.issues, highlight_differences)
 else:
     logger.info("No document loaded, displaying info message")
     st.info("Выберите способ ввода текста и загрузите документ для анализа")
 
+render_history(analysis_history(), current_key, highlight_differences)
+render_metrics_panel(metrics)
+
 # Footer
 st.markdown("---")
 st.markdown("© 2025 Pedantic Lawyer - Инструмент для анализа нормативных правовых актов ЯНАО")